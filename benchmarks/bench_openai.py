@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+import time
+from bot.chatgpt_client import ChatGPTClient
+from .stub_openai import StubOpenAIServer
+
+
+class _StaticConfig:
+    """Minimal stand-in for ConfigManager exposing a fixed prompt"""
+
+    def __init__(self, prompt: str):
+        self.instructions = {"prompt": prompt}
+
+
+async def _run_level(client: ChatGPTClient, concurrency: int, requests: int) -> float:
+    """Send `requests` completions over `concurrency` chats and return requests/sec"""
+    per_chat = max(1, requests // concurrency)
+
+    async def chat(chat_id: int) -> None:
+        for i in range(per_chat):
+            await client.get_response(chat_id, f"message {i}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(chat(chat_id) for chat_id in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return per_chat * concurrency / elapsed
+
+
+async def main(args) -> None:
+    server = StubOpenAIServer(latency=args.latency)
+    await server.start()
+    try:
+        for concurrency in args.concurrency:
+            client = ChatGPTClient(
+                "stub-key",
+                _StaticConfig("You are a benchmark."),
+                max_concurrency=args.max_in_flight,
+                base_url=server.base_url
+            )
+            throughput = await _run_level(client, concurrency, args.requests)
+            print(f"concurrency={concurrency:<5} throughput={throughput:8.1f} req/s")
+            await client.client.close()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure ChatGPTClient throughput against a stub OpenAI server")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub completion latency in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="Completions per concurrency level")
+    parser.add_argument("--max-in-flight", type=int, default=100, help="ChatGPTClient concurrency cap")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+import aiohttp
+from aiohttp import web
+
+
+def make_user(chat_id: int) -> Dict[str, Any]:
+    return {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}", "username": f"user{chat_id}"}
+
+
+def make_text_update(update_id: int, chat_id: int, text: str) -> Dict[str, Any]:
+    """Build a raw Telegram update for a private text message (commands get a bot_command entity)"""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": make_user(chat_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_contact_update(update_id: int, chat_id: int, phone: str, first_name: str) -> Dict[str, Any]:
+    """Build a raw Telegram update for a shared contact"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": make_user(chat_id),
+            "contact": {"phone_number": phone, "first_name": first_name, "user_id": chat_id},
+        },
+    }
+
+
+class FakeTelegramServer:
+    """
+    Local stand-in for the Telegram Bot API
+
+    Answers the methods the bot uses, records every message it "delivers" and
+    serves injected updates through getUpdates. Point the bot at it with
+    TELEGRAM_BASE_URL=<base_url>.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.sent: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1)
+        self._updates: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Queue an update to be returned by getUpdates"""
+        self._updates.put_nowait(update)
+
+    @property
+    def pending_updates(self) -> int:
+        return self._updates.qsize()
+
+    def wait_for_message(self, chat_id: int) -> "asyncio.Future[Dict[str, Any]]":
+        """Future resolved with the next message sent (or edited) in a chat"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(future)
+        return future
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            # python-telegram-bot form-encodes parameters, JSON-encoding non-string values
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    def _message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    def _deliver(self, message: Dict[str, Any]) -> None:
+        self.sent.append(message)
+        for waiter in self._waiters.pop(message["chat"]["id"], []):
+            if not waiter.done():
+                waiter.set_result(message)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                           "can_join_groups": True, "can_read_all_group_messages": False,
+                           "supports_inline_queries": False}
+        elif method == "sendMessage":
+            result = self._message(int(params["chat_id"]), str(params["text"]))
+            self._deliver(result)
+        elif method == "editMessageText":
+            result = self._message(int(params["chat_id"]), str(params["text"]), int(params["message_id"]))
+            self._deliver(result)
+        elif method == "getUpdates":
+            result = await self._get_updates(float(params.get("timeout", 0)))
+        elif method in ("setWebhook", "deleteWebhook", "sendChatAction", "setMyCommands"):
+            result = True
+        else:
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, timeout: float) -> List[Dict[str, Any]]:
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout or 0.01))
+        except asyncio.TimeoutError:
+            return updates
+        while not self._updates.empty() and len(updates) < 100:
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class WebhookSender:
+    """Posts updates to the bot's webhook the way Telegram does, including the secret token header"""
+
+    def __init__(self, url: str, secret: Optional[str] = None):
+        self.url = url
+        self.secret = secret
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def post(self, update: Dict[str, Any]) -> int:
+        """Post an update and return the HTTP status"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret} if self.secret else {}
+        async with self._session.post(self.url, json=update, headers=headers) as response:
+            return response.status
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def _post_updates(args) -> None:
+    sender = WebhookSender(args.url, args.secret)
+    started = time.perf_counter()
+    statuses: Dict[int, int] = defaultdict(int)
+    try:
+        for batch_start in range(0, args.updates, args.concurrency):
+            batch = range(batch_start, min(batch_start + args.concurrency, args.updates))
+            results = await asyncio.gather(*(
+                sender.post(make_text_update(i + 1, args.first_chat + i % args.chats, f"Message {i}"))
+                for i in batch
+            ))
+            for status in results:
+                statuses[status] += 1
+    finally:
+        await sender.close()
+    elapsed = time.perf_counter() - started
+    print(f"Posted {args.updates} updates in {elapsed:.2f}s ({args.updates / elapsed:.1f}/s), "
+          f"statuses: {dict(statuses)}")
+
+
+async def _serve(args) -> None:
+    server = FakeTelegramServer(host=args.host, port=args.port, latency=args.latency)
+    await server.start()
+    print(f"Fake Telegram Bot API listening, set TELEGRAM_BASE_URL={server.base_url}")
+
+    # Synthetic traffic for a polling bot: every chat registers, then sends text messages
+    update_ids = itertools.count(1)
+    chat_ids = [args.first_chat + i for i in range(args.chats)] if args.updates else []
+    for chat_id in chat_ids:
+        server.push_update(make_contact_update(next(update_ids), chat_id, f"+380{chat_id}", f"User {chat_id}"))
+    for i in range(args.updates):
+        chat_id = chat_ids[i % len(chat_ids)]
+        server.push_update(make_text_update(next(update_ids), chat_id, f"Message {i}"))
+
+    while True:
+        await asyncio.sleep(5)
+        if args.updates:
+            chats = len({message["chat"]["id"] for message in server.sent})
+            print(f"{len(server.sent)} messages delivered to {chats} chats, {server.pending_updates} updates unread")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local Telegram stand-ins for testing the bot")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run a fake Bot API server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8082)
+    serve.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API call")
+    serve.add_argument("--updates", type=int, default=0, help="Text updates to queue for getUpdates")
+    serve.add_argument("--chats", type=int, default=10)
+    serve.add_argument("--first-chat", type=int, default=1000)
+    serve.set_defaults(handler=_serve)
+
+    post = commands.add_parser("post", help="Post synthetic updates to a bot webhook")
+    post.add_argument("url", help="Webhook URL, e.g. http://127.0.0.1:8443/telegram")
+    post.add_argument("--secret", help="Webhook secret token")
+    post.add_argument("--updates", type=int, default=100)
+    post.add_argument("--chats", type=int, default=10)
+    post.add_argument("--first-chat", type=int, default=1000)
+    post.add_argument("--concurrency", type=int, default=10)
+    post.set_defaults(handler=_post_updates)
+
+    arguments = parser.parse_args()
+    asyncio.run(arguments.handler(arguments))
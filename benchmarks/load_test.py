@@ -0,0 +1,223 @@
+"""
+End-to-end load test of TelegramBot with local stand-ins
+
+Drives the real Application and MessageHandlers with synthetic updates from
+many chats. Telegram is replaced by FakeTelegramServer and OpenAI by
+StubOpenAIServer; user data goes to the MySQL database configured through
+the usual DB_* variables, which should point at a local, disposable
+instance. Everything runs offline.
+
+Usage:
+    python -m benchmarks.load_test --chats 200 --messages 10 --openai-latency 0.5
+    python -m benchmarks.load_test --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .fake_telegram import FakeTelegramServer, make_text_update
+from .stub_openai import StubOpenAIServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FIRST_CHAT_ID = 10_000_000
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _configure_environment(args, telegram: FakeTelegramServer, openai_url: str, workdir: str) -> None:
+    """Point the bot at the stand-ins; config.py reads these on import"""
+    os.environ.update({
+        "TELEGRAM_BASE_URL": telegram.base_url,
+        "OPENAI_BASE_URL": openai_url,
+        "METRICS_PORT": "0",
+        "CONFIG_RELOAD_INTERVAL": "0",
+        "HISTORY_SQLITE_PATH": os.path.join(workdir, "history.sqlite3"),
+        "STREAM_REPLIES": "true" if args.stream else "false",
+        # Synthetic chats send faster than a person; measure the pipeline, not admission control
+        "CHAT_MESSAGE_RATE": "0",
+        "MESSAGE_DEBOUNCE": "0",
+    })
+    for override in args.env:
+        key, _, value = override.partition("=")
+        os.environ[key] = value
+
+
+async def _seed_users(bot, chat_ids: List[int]) -> None:
+    """Give every synthetic chat a complete profile so its messages reach ChatGPT"""
+    for start in range(0, len(chat_ids), 100):
+        await asyncio.gather(*(
+            bot.user_manager.register_contact(chat_id, f"Load {chat_id}", f"+380{chat_id}")
+            for chat_id in chat_ids[start:start + 100]
+        ))
+
+
+def _delete_users(conn, chat_ids: List[int]) -> None:
+    cursor = conn.cursor()
+    placeholders = ", ".join(["%s"] * len(chat_ids))
+    cursor.execute(f"DELETE FROM users WHERE chat_id IN ({placeholders})", chat_ids)
+    conn.commit()
+
+
+async def _run_chat(bot, telegram: FakeTelegramServer, chat_id: int, messages: int,
+                    expected_reply: str, update_ids, latencies: List[float], timeout: float) -> int:
+    """Send messages one after another, each after the previous reply was complete"""
+    from telegram import Update
+
+    failures = 0
+    for i in range(messages):
+        started = time.perf_counter()
+        waiter = telegram.wait_for_message(chat_id)
+        update = make_text_update(next(update_ids), chat_id, f"Question {i} from {chat_id}")
+        await bot.app.update_queue.put(Update.de_json(update, bot.app.bot))
+        try:
+            # Streamed replies arrive as several edits; wait for the complete text
+            while True:
+                reply = await asyncio.wait_for(waiter, timeout)
+                if reply["text"] == expected_reply:
+                    break
+                waiter = telegram.wait_for_message(chat_id)
+            latencies.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            failures += 1
+    return failures
+
+
+async def run(args) -> Dict[str, Any]:
+    telegram = FakeTelegramServer(latency=args.telegram_latency)
+    await telegram.start()
+    stub: Optional[StubOpenAIServer] = None
+    openai_url = args.openai_url
+    if openai_url is None:
+        stub = StubOpenAIServer(latency=args.openai_latency, reply=args.reply)
+        await stub.start()
+        openai_url = stub.base_url
+
+    workdir = tempfile.mkdtemp(prefix="bot-load-")
+    _configure_environment(args, telegram, openai_url, workdir)
+
+    # Imported only now, so config.py sees the environment above
+    from bot.core import TelegramBot
+    from config import CONFIG_FILE
+
+    bot = TelegramBot(telegram_token="123456:load-test", openai_api_key="stub", config_file=CONFIG_FILE)
+    await bot.start()
+    chat_ids = [FIRST_CHAT_ID + i for i in range(args.chats)]
+    latencies: List[float] = []
+    try:
+        await _seed_users(bot, chat_ids)
+        update_ids = itertools.count(1)
+        started = time.perf_counter()
+        failures = await asyncio.gather(*(
+            _run_chat(bot, telegram, chat_id, args.messages, args.reply, update_ids, latencies, args.timeout)
+            for chat_id in chat_ids
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        if args.cleanup:
+            await bot.user_manager.db.run(_delete_users, chat_ids)
+        await bot.stop()
+        if stub is not None:
+            await stub.stop()
+        await telegram.stop()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "parameters": {
+            "chats": args.chats,
+            "messages": args.messages,
+            "openai_latency": args.openai_latency if stub is not None else None,
+            "telegram_latency": args.telegram_latency,
+            "stream": args.stream,
+            "env": args.env,
+        },
+        "messages_sent": args.chats * args.messages,
+        "replies": len(latencies),
+        "timeouts": sum(failures),
+        "elapsed_seconds": elapsed,
+        "messages_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "latency_p99": _percentile(latencies, 99),
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "send_queue": bot.message_sender.stats(),
+        "update_queue": bot.update_processor.stats(),
+    }
+
+
+def _print_report(result: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> None:
+    rows = [
+        ("messages/sec", "messages_per_second", "{:.1f}"),
+        ("p50 latency (s)", "latency_p50", "{:.3f}"),
+        ("p95 latency (s)", "latency_p95", "{:.3f}"),
+        ("p99 latency (s)", "latency_p99", "{:.3f}"),
+        ("peak RSS (MB)", "peak_rss_mb", "{:.1f}"),
+        ("timeouts", "timeouts", "{}"),
+    ]
+    print(f"{result['replies']}/{result['messages_sent']} replies in {result['elapsed_seconds']:.1f}s")
+    for label, key, fmt in rows:
+        line = f"{label:<18}{fmt.format(result[key]):>12}"
+        if previous is not None and previous.get(key):
+            change = (result[key] - previous[key]) / previous[key] * 100
+            line += f"   ({change:+.1f}% vs {fmt.format(previous[key])})"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the bot against local Telegram and OpenAI stand-ins")
+    parser.add_argument("--chats", type=int, default=200, help="Number of concurrent synthetic chats")
+    parser.add_argument("--messages", type=int, default=10, help="Messages sent by each chat")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="Stub completion latency in seconds")
+    parser.add_argument("--openai-url", help="Use an already running OpenAI stand-in instead of the built-in stub")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Latency of the fake Bot API")
+    parser.add_argument("--reply", default="This is a benchmark reply from the stub model.")
+    parser.add_argument("--stream", action="store_true", help="Benchmark streamed replies")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for a reply")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a config variable, e.g. --env TELEGRAM_CHAT_RATE=100")
+    parser.add_argument("--no-cleanup", dest="cleanup", action="store_false",
+                        help="Keep the synthetic users in the database")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    _print_report(result, previous)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{result['timestamp'].replace(':', '-')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+from aiohttp import web
+
+
+class StubOpenAIServer:
+    """Local stand-in for the OpenAI chat completions API with configurable latency"""
+
+    def __init__(self, latency: float = 0.5, reply: str = "Stub reply", host: str = "127.0.0.1", port: int = 0,
+                 token_interval: float = 0.02):
+        self.latency = latency
+        self.token_interval = token_interval
+        self.reply = reply
+        self.host = host
+        self.port = port
+        self.requests_served = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        self.requests_served += 1
+        if body.get("stream"):
+            return await self._stream(request, body)
+        return web.json_response({
+            "id": f"chatcmpl-stub-{self.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    async def _model(self, request: web.Request) -> web.Response:
+        """Model lookup, used by the bot to open and verify connections at startup"""
+        return web.json_response({
+            "id": request.match_info["model"], "object": "model", "created": 0, "owned_by": "stub"
+        })
+
+    async def _stream(self, request: web.Request, body: dict) -> web.StreamResponse:
+        """Send the reply word by word as server-sent events, like the real streaming API"""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def event(delta: dict, finish_reason=None) -> bytes:
+            payload = {
+                "id": f"chatcmpl-stub-{self.requests_served}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        await response.write(event({"role": "assistant", "content": ""}))
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            await response.write(event({"content": word if i == 0 else " " + word}))
+            await asyncio.sleep(self.token_interval)
+        await response.write(event({}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        app.router.add_get("/v1/models/{model}", self._model)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Resolve the real port when an ephemeral one was requested
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args) -> None:
+    server = StubOpenAIServer(latency=args.latency, host=args.host, port=args.port)
+    await server.start()
+    print(f"Stub OpenAI listening on {server.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local stub OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before replying")
+    asyncio.run(_serve(parser.parse_args()))
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from .rate_limit import KeyedTokenBuckets, TokenBucket
+
+
+class _PendingChat:
+    """Messages of one chat waiting for a turn, plus the task producing the turns"""
+
+    __slots__ = ("texts", "task", "last_added")
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self.last_added = 0.0
+
+
+class MessageCoalescer:
+    def __init__(
+            self,
+            process: Callable[[int, str], Awaitable[None]],
+            rate: float = 1.0,
+            burst: float = 20,
+            debounce: float = 1.0,
+            max_chats: int = 200
+    ):
+        """
+        Per-chat admission control for messages going to ChatGPT
+
+        Each chat has a token bucket limiting how many messages it may send.
+        A message of a chat without pending work starts a turn right away.
+        Messages arriving while a reply is being generated are merged into the
+        next turn, which starts once the chat has been quiet for the debounce
+        window, so a chat never has more than one request in flight.
+
+        At most max_chats chats have a turn running or waiting. A message
+        starting a new chat's turn beyond that waits in add(), which holds up
+        the update being handled, so an overload backs up into the update
+        processor's queue and backlog instead of piling up turns.
+
+        Args:
+            process (Callable[[int, str], Awaitable[None]]): Produces and sends the reply to a merged turn
+            rate (float): Messages per second a chat may send in the long run (0 disables the limit)
+            burst (float): Messages a chat may send in a quick burst
+            debounce (float): Seconds without new messages before a follow-up turn starts
+            max_chats (int): Maximum number of chats with a turn running or waiting
+        """
+        self.process = process
+        self.debounce = debounce
+        self.max_chats = max_chats
+        self._buckets = KeyedTokenBuckets(rate, burst) if rate > 0 else None
+        self._pending: Dict[int, _PendingChat] = {}
+        # Chats that were already told to slow down in the current limit episode,
+        # with the time their bucket has a token again and the episode ends
+        self._limited: Dict[int, float] = {}
+        self._room = asyncio.Event()
+        self._room.set()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.turns = 0
+        self.running = 0
+        self.waiting = 0
+
+    async def add(self, chat_id: int, text: str) -> Optional[bool]:
+        """
+        Offer a message of a chat for processing
+
+        Returns once the message is queued, which only waits while max_chats
+        chats have turns; the reply is produced in the background.
+
+        Args:
+            chat_id (int): Chat the message came from
+            text (str): Message text
+
+        Returns:
+            Optional[bool]: True if the message was admitted, False if it was rejected
+            and the chat should be told to slow down, None if it was rejected and
+            the chat was already told
+        """
+        if self._buckets is not None:
+            bucket = self._buckets.get(chat_id)
+            if not bucket.try_acquire():
+                self.rejected += 1
+                if chat_id in self._limited:
+                    return None
+                self._limit(chat_id, bucket)
+                return False
+
+        self._limited.pop(chat_id, None)
+        self.admitted += 1
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            self.waiting += 1
+            try:
+                while len(self._pending) >= self.max_chats:
+                    self._room.clear()
+                    await self._room.wait()
+            finally:
+                self.waiting -= 1
+            # Nothing else adds messages of this chat meanwhile: its updates are handled in order
+            pending = self._pending[chat_id] = _PendingChat()
+        pending.texts.append(text)
+        pending.last_added = time.monotonic()
+        if pending.task is None:
+            pending.task = asyncio.create_task(self._run(chat_id, pending))
+        return True
+
+    def _limit(self, chat_id: int, bucket: TokenBucket) -> None:
+        """Start a limit episode for a chat, ending the episodes of chats whose bucket refilled since"""
+        now = time.monotonic()
+        for expired in [limited for limited, until in self._limited.items() if until <= now]:
+            del self._limited[expired]
+        self._limited[chat_id] = now + (1 - bucket.tokens) / bucket.rate
+
+    async def _quiet(self, pending: _PendingChat) -> None:
+        """Wait until the chat sent no message for the debounce window"""
+        delay = pending.last_added + self.debounce - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = pending.last_added + self.debounce - time.monotonic()
+
+    async def _run(self, chat_id: int, pending: _PendingChat) -> None:
+        first = True
+        try:
+            while pending.texts:
+                if not first:
+                    await self._quiet(pending)
+                first = False
+                text = "\n\n".join(pending.texts)
+                pending.texts = []
+                self.turns += 1
+                self.running += 1
+                try:
+                    await self.process(chat_id, text)
+                except Exception as e:
+                    logging.error(f"Error processing messages of chat {chat_id}: {e}")
+                finally:
+                    self.running -= 1
+        finally:
+            # No await between the last check of texts and this point, so
+            # add() either saw the running task or will start a new one
+            self._pending.pop(chat_id, None)
+            self._room.set()
+
+    @property
+    def pending_chats(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get admission statistics
+
+        Returns:
+            Dict[str, int]: Admitted and rejected messages, merged turns, chats with pending
+            work, turns being answered and messages waiting for room
+        """
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "turns": self.turns,
+            "pending_chats": self.pending_chats,
+            "running": self.running,
+            "waiting": self.waiting,
+        }
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Wait up to timeout seconds for pending turns to be answered, then cancel the rest"""
+        tasks = [pending.task for pending in self._pending.values() if pending.task is not None]
+        if not tasks:
+            return
+        _, remaining = await asyncio.wait(tasks, timeout=timeout)
+        if remaining:
+            logging.warning(f"Dropping pending messages of {len(remaining)} chats on shutdown")
+            for task in remaining:
+                task.cancel()
+            await asyncio.gather(*remaining, return_exceptions=True)
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Set
+from telegram.error import Forbidden, TelegramError
+from .formatting import MAX_MESSAGE_LENGTH, text_length
+
+# Outcome of a single delivery
+_SENT, _BLOCKED, _FAILED = "sent", "blocked", "failed"
+
+
+class BroadcastError(Exception):
+    pass
+
+
+class _Progress:
+    """Counters of a running broadcast, as checkpointed"""
+
+    __slots__ = ("broadcast_id", "text", "admin_chat_id", "last_chat_id", "sent", "blocked", "failed", "total",
+                 "started", "done_at_start")
+
+    def __init__(self, row: Dict[str, Any]):
+        self.broadcast_id = row["id"]
+        self.text = row["text"]
+        self.admin_chat_id = row["admin_chat_id"]
+        self.last_chat_id = row["last_chat_id"]
+        self.sent = row["sent"]
+        self.blocked = row["blocked"]
+        self.failed = row["failed"]
+        self.total = row["total"]
+        self.started = time.monotonic()
+        self.done_at_start = self.done
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def rate(self) -> float:
+        """Deliveries per second in this run"""
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.done_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def report(self, status: str) -> str:
+        line = (
+            f"📣 Broadcast #{self.broadcast_id} {status}: {self.done}/{self.total} "
+            f"(sent {self.sent}, blocked {self.blocked}, failed {self.failed}), {self.rate:.1f} msg/s"
+        )
+        remaining = max(0, self.total - self.done)
+        if status == "running" and self.rate > 0 and remaining:
+            minutes, seconds = divmod(int(remaining / self.rate), 60)
+            line += f", ETA {minutes}m {seconds:02d}s"
+        return line
+
+
+class Broadcaster:
+    # Columns the bot relies on, checked at startup
+    SCHEMA = {"broadcasts": ("id", "text", "admin_chat_id", "status", "last_chat_id", "sent", "blocked", "failed",
+                             "total", "updated_at")}
+
+    def __init__(
+            self,
+            message_sender,
+            user_manager,
+            page_size: int = 100,
+            report_interval: float = 30.0,
+            stale_after: float = 300.0
+    ):
+        """
+        Send a message to every user who has not blocked the bot
+
+        Recipients are read page by page in chat_id order and each page is
+        queued on the sender's bulk lane, so broadcasts go out at the global
+        Telegram rate while replies to users keep precedence. After every page
+        the last chat_id and counters are checkpointed in the broadcasts
+        table; an interrupted broadcast resumes after its checkpoint, resending
+        at most one page. Users who blocked the bot are marked and skipped by
+        later broadcasts.
+
+        Args:
+            message_sender (MessageSender): Outbound queue
+            user_manager (UserManager): Source of recipients
+            page_size (int): Recipients read and checkpointed at a time
+            report_interval (float): Seconds between progress reports to the admin
+            stale_after (float): Seconds without a checkpoint after which a running broadcast counts as orphaned
+        """
+        self.message_sender = message_sender
+        self.user_manager = user_manager
+        self.db = user_manager.db
+        self.page_size = page_size
+        self.report_interval = report_interval
+        self.stale_after = stale_after
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: Set[int] = set()
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Create the broadcasts table"""
+        try:
+            with self.user_manager.db_pool.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS broadcasts (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        text TEXT NOT NULL,
+                        admin_chat_id BIGINT NOT NULL,
+                        status VARCHAR(16) NOT NULL DEFAULT 'running',
+                        last_chat_id BIGINT NOT NULL DEFAULT 0,
+                        sent INT NOT NULL DEFAULT 0,
+                        blocked INT NOT NULL DEFAULT 0,
+                        failed INT NOT NULL DEFAULT 0,
+                        total INT NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        INDEX idx_status (status)
+                    )
+                ''')
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Broadcast table initialization error: {e}")
+            raise
+
+    @property
+    def running(self) -> List[int]:
+        return sorted(self._tasks)
+
+    async def start(self, text: str, admin_chat_id: int) -> int:
+        """
+        Start a broadcast in the background
+
+        Args:
+            text (str): Message to send
+            admin_chat_id (int): Chat receiving progress reports
+
+        Returns:
+            int: Broadcast ID
+
+        Raises:
+            BroadcastError: If the text is empty or too long, or the broadcast could not be created
+        """
+        if not text.strip():
+            raise BroadcastError("The message is empty")
+        if text_length(text) > MAX_MESSAGE_LENGTH:
+            raise BroadcastError(f"The message is longer than {MAX_MESSAGE_LENGTH} characters")
+
+        total = await self.user_manager.count_recipients()
+        if total is None:
+            raise BroadcastError("Could not count recipients")
+        try:
+            broadcast_id = await self.db.run(self._create, text, admin_chat_id, total)
+        except Exception as e:
+            logging.error(f"Error creating broadcast: {e}")
+            raise BroadcastError("Could not create the broadcast") from e
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    @staticmethod
+    def _create(conn, text: str, admin_chat_id: int, total: int) -> int:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO broadcasts (text, admin_chat_id, total) VALUES (%s, %s, %s)",
+            (text, admin_chat_id, total)
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+    async def resume(self) -> None:
+        """Resume broadcasts interrupted by a shutdown or orphaned by a crashed process"""
+        try:
+            broadcast_ids = await self.db.run(self._claim_resumable, self.stale_after)
+        except Exception as e:
+            logging.error(f"Error resuming broadcasts: {e}")
+            return
+        for broadcast_id in broadcast_ids:
+            logging.info(f"Resuming broadcast #{broadcast_id}")
+            self._spawn(broadcast_id)
+
+    @staticmethod
+    def _claim_resumable(conn, stale_after: float) -> List[int]:
+        cursor = conn.cursor()
+        condition = """
+            status = 'interrupted'
+            OR (status = 'running' AND updated_at < NOW() - INTERVAL %s SECOND)
+        """
+        cursor.execute(f"SELECT id FROM broadcasts WHERE {condition}", (int(stale_after),))
+        claimed = []
+        for (broadcast_id,) in cursor.fetchall():
+            # The conditional update makes sure only one process picks up a broadcast
+            cursor.execute(
+                f"UPDATE broadcasts SET status = 'running', updated_at = NOW() WHERE id = %s AND ({condition})",
+                (broadcast_id, int(stale_after))
+            )
+            if cursor.rowcount:
+                claimed.append(broadcast_id)
+        conn.commit()
+        return claimed
+
+    async def cancel(self) -> List[int]:
+        """Cancel the broadcasts running in this process and return their IDs"""
+        cancelled = self.running
+        self._cancelled.update(cancelled)
+        await self._stop_tasks()
+        return cancelled
+
+    async def stop(self) -> None:
+        """Interrupt running broadcasts at shutdown; they resume on the next start"""
+        await self._stop_tasks()
+
+    async def _stop_tasks(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, broadcast_id: int) -> None:
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _run(self, broadcast_id: int) -> None:
+        try:
+            row = await self.db.run(self._load, broadcast_id)
+        except Exception as e:
+            logging.error(f"Error loading broadcast #{broadcast_id}: {e}")
+            return
+        progress = _Progress(row)
+        status = "done"
+        try:
+            await self._report(progress, "started" if progress.done == 0 else "resumed")
+            last_report = time.monotonic()
+            while True:
+                page = await self.user_manager.get_recipients(progress.last_chat_id, self.page_size)
+                if page is None:
+                    status = "interrupted"
+                    break
+                if not page:
+                    break
+
+                outcomes = await asyncio.gather(*(self._send(chat_id, progress.text) for chat_id in page))
+                blocked = [chat_id for chat_id, outcome in zip(page, outcomes) if outcome == _BLOCKED]
+                await self.user_manager.mark_blocked(blocked)
+                progress.sent += outcomes.count(_SENT)
+                progress.failed += outcomes.count(_FAILED)
+                progress.blocked += len(blocked)
+                progress.last_chat_id = page[-1]
+                await self._checkpoint(progress, "running")
+
+                if time.monotonic() - last_report >= self.report_interval:
+                    await self._report(progress, "running")
+                    last_report = time.monotonic()
+        except asyncio.CancelledError:
+            status = "cancelled" if broadcast_id in self._cancelled else "interrupted"
+            self._cancelled.discard(broadcast_id)
+            await self._checkpoint(progress, status)
+            if status == "cancelled":
+                await self._report(progress, status)
+            raise
+
+        await self._checkpoint(progress, status)
+        await self._report(progress, status)
+
+    async def _send(self, chat_id: int, text: str) -> str:
+        bot = self.message_sender.bot
+        try:
+            await self.message_sender.submit(
+                chat_id,
+                lambda: bot.send_message(chat_id=chat_id, text=text),
+                self.message_sender.PRIORITY_BULK
+            )
+            return _SENT
+        except Forbidden:
+            self.message_sender.active_chats.discard(chat_id)
+            return _BLOCKED
+        except TelegramError as e:
+            logging.warning(f"Broadcast to {chat_id} failed: {e}")
+            return _FAILED
+
+    @staticmethod
+    def _load(conn, broadcast_id: int) -> Dict[str, Any]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, text, admin_chat_id, last_chat_id, sent, blocked, failed, total
+            FROM broadcasts
+            WHERE id = %s
+        """, (broadcast_id,))
+        return cursor.fetchone()
+
+    async def _checkpoint(self, progress: _Progress, status: str) -> None:
+        try:
+            await self.db.run(self._save, progress, status)
+        except Exception as e:
+            logging.error(f"Error checkpointing broadcast #{progress.broadcast_id}: {e}")
+
+    @staticmethod
+    def _save(conn, progress: _Progress, status: str) -> None:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE broadcasts
+            SET status = %s, last_chat_id = %s, sent = %s, blocked = %s, failed = %s, updated_at = NOW()
+            WHERE id = %s
+        """, (status, progress.last_chat_id, progress.sent, progress.blocked, progress.failed,
+              progress.broadcast_id))
+        conn.commit()
+
+    async def _report(self, progress: _Progress, status: str) -> None:
+        report = progress.report(status)
+        logging.info(report)
+        await self.message_sender.send_message(
+            progress.admin_chat_id,
+            report,
+            priority=self.message_sender.PRIORITY_NOTIFICATION
+        )
@@ -0,0 +1,128 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Size-bounded LRU cache whose entries expire after a fixed time
+
+        Args:
+            max_size (int): Maximum number of entries; least recently used ones are evicted first
+            ttl (float): Seconds an entry stays valid after it was written
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Get a cached value
+
+        Args:
+            key (Hashable): Cache key
+
+        Returns:
+            Optional[V]: Cached value or None on a miss or expired entry
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """Store a value, evicting the least recently used entries when full"""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        # A snapshot, so entries can be invalidated while iterating
+        return iter(list(self._entries))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics
+
+        Returns:
+            Dict[str, Any]: Size, hit and miss counters and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResponseCache:
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Cache of assistant replies to common opening questions
+
+        Entries are keyed on the normalized question text and a hash of the
+        system prompt; all entries are dropped when the prompt changes.
+
+        Args:
+            max_size (int): Maximum number of cached replies
+            ttl (float): Seconds a reply stays valid
+        """
+        self._cache: TTLCache[str] = TTLCache(max_size, ttl)
+        self._prompt: Optional[str] = None
+        self._prompt_hash = ""
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Case-fold, collapse whitespace and drop trailing punctuation"""
+        return " ".join(text.casefold().split()).rstrip("?!.…, ")
+
+    def _key(self, prompt: str, text: str) -> Tuple[str, str]:
+        if prompt is not self._prompt and prompt != self._prompt:
+            # The prompt changed (e.g. a config reload): old replies no longer apply
+            self._cache.clear()
+            self._prompt = prompt
+            self._prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        return self._prompt_hash, self.normalize(text)
+
+    def get(self, prompt: str, text: str) -> Optional[str]:
+        """Get the cached reply to a question under the given prompt"""
+        return self._cache.get(self._key(prompt, text))
+
+    def set(self, prompt: str, text: str, reply: str) -> None:
+        """Cache a reply to a question under the given prompt"""
+        self._cache.set(self._key(prompt, text), reply)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get size, hit/miss counters and hit rate"""
+        return self._cache.stats()
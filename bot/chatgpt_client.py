@@ -1,21 +1,114 @@
-from openai import OpenAI
-from typing import List, Dict, Any, Optional
+import hashlib
+import httpx
+from openai import AsyncOpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+import asyncio
 import logging
+import time
 from .config_manager import ConfigManager
+from .conversation_store import Conversation, ConversationStore
+from .history_backend import HistoryBackend, PROMPT_ROLE, SUMMARY_ROLE
+from .cache import ResponseCache
+from .resilience import ResilientCaller
+from .tracing import span
+from .metrics import OPENAI_LATENCY, OPENAI_FIRST_TOKEN, OPENAI_IN_FLIGHT, ERRORS
+from .tokenizer import REPLY_OVERHEAD_TOKENS
 
 
 class ChatGPTClient:
-    def __init__(self, oai_api_key: str, config_manager: ConfigManager):
+    ERROR_MESSAGE = "I apologize, but I'm having trouble processing your request right now."
+
+    def __init__(
+            self,
+            oai_api_key: str,
+            config_manager: ConfigManager,
+            max_concurrency: int = 50,
+            request_timeout: float = 30.0,
+            base_url: Optional[str] = None,
+            conversation_store: Optional[ConversationStore] = None,
+            model: str = "gpt-3.5-turbo",
+            max_tokens: int = 700,
+            context_token_budget: int = 4096,
+            history_backend: Optional[HistoryBackend] = None,
+            response_cache: Optional[ResponseCache] = None,
+            cache_max_history: int = 0,
+            resilience: Optional[ResilientCaller] = None,
+            pool_size: Optional[int] = None,
+            keepalive_expiry: float = 60.0
+    ):
         """
         Initialize ChatGPT client
 
         Args:
             oai_api_key (str): OpenAI API key
             config_manager (ConfigManager): Instance of ConfigManager for accessing prompts
+            max_concurrency (int): Maximum number of completions in flight at once
+            request_timeout (float): Timeout in seconds for a single completion request
+            base_url (Optional[str]): Override for the OpenAI API URL (e.g. a local stub server)
+            conversation_store (Optional[ConversationStore]): Store for conversation histories
+            model (str): Chat completion model
+            max_tokens (int): Maximum number of tokens in a reply
+            context_token_budget (int): Token budget for prompt, history and reply combined
+            history_backend (Optional[HistoryBackend]): Persistent storage for conversations
+            response_cache (Optional[ResponseCache]): Cache of replies to common questions
+            cache_max_history (int): Prior messages a conversation may have for its turn to use the cache
+            resilience (Optional[ResilientCaller]): Retry, hedging and circuit-breaker policy for completions
+            pool_size (Optional[int]): HTTP connections kept open to OpenAI, defaults to max_concurrency
+            keepalive_expiry (float): Seconds an idle connection is kept before it is closed
         """
-        self.client = OpenAI(api_key=oai_api_key)
+        pool_size = pool_size or max_concurrency
+        self.client = AsyncOpenAI(
+            api_key=oai_api_key,
+            base_url=base_url,
+            timeout=request_timeout,
+            # Retries are done by the resilience policy
+            max_retries=0,
+            # Keep a connection per concurrent request alive between bursts, so
+            # requests don't pay for a new TLS handshake
+            http_client=httpx.AsyncClient(
+                timeout=request_timeout,
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=keepalive_expiry
+                )
+            )
+        )
         self.config_manager = config_manager
-        self.conversations: Dict[int, List[Dict[str, str]]] = {}
+        self.conversations = conversation_store or ConversationStore()
+        self.history_backend = history_backend
+        self.response_cache = response_cache
+        self.cache_max_history = cache_max_history
+        self.request_timeout = request_timeout
+        self.model = model
+        self.max_tokens = max_tokens
+        # Tokens left for the system prompt and history once the reply is reserved
+        self.history_token_budget = context_token_budget - max_tokens - REPLY_OVERHEAD_TOKENS
+        self.resilience = resilience or ResilientCaller(model)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def warm_up(self, connections: int) -> bool:
+        """
+        Open and verify connections to OpenAI before the first user request
+
+        Looks up the configured model on several concurrent requests, which
+        makes the HTTP client open (and keep) that many connections and checks
+        the API key and model.
+
+        Args:
+            connections (int): Number of connections to open
+
+        Returns:
+            bool: True if every lookup succeeded
+        """
+        results = await asyncio.gather(
+            *(self.client.models.retrieve(self.model) for _ in range(max(1, connections))),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logging.error(f"OpenAI warm-up failed on {len(errors)}/{len(results)} connections: {errors[0]}")
+        return not errors
 
     async def get_response(
             self,
@@ -34,62 +127,177 @@ class ChatGPTClient:
             str: ChatGPT's response
         """
         try:
-            # Get system prompt from config
-            system_prompt = self.config_manager.instructions['prompt']
-
-            # Initialize or update conversation with new system prompt
-            if chat_id not in self.conversations:
-                self.conversations[chat_id] = []
-
-            # If conversation exists but system prompt is different, reset conversation
-            if self.conversations[chat_id]:
-                current_system_prompt = self.conversations[chat_id][0]["content"]
-                if current_system_prompt != system_prompt:
-                    self.conversations[chat_id] = []
-
-            # Add system prompt if it's a new conversation
-            if not self.conversations[chat_id]:
-                self.conversations[chat_id].append({
-                    "role": "system",
-                    "content": system_prompt
-                })
-
-            # Add user message
-            self.conversations[chat_id].append({
-                "role": "user",
-                "content": user_message
-            })
-
-            # Keep conversation history limited
-            # Keep system prompt and last 4 exchanges (8 messages: 4 user + 4 assistant)
-            if len(self.conversations[chat_id]) > 9:  # system prompt + 8 messages
-                self.conversations[chat_id] = (
-                        [self.conversations[chat_id][0]] +  # Keep system prompt
-                        self.conversations[chat_id][-8:]  # Keep last 8 messages
-                )
+            conversation, messages = await self._start_turn(chat_id, user_message)
 
-            # Get response from ChatGPT
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=self.conversations[chat_id],
-                max_tokens=700,
-                temperature=0.7,  # Add some variability to responses
-                presence_penalty=0.7,  # Encourage new topics
-                frequency_penalty=0.6  # Reduce repetition
-            )
+            cacheable = self._is_cacheable(conversation)
+            if cacheable:
+                cached = self.response_cache.get(conversation.prompt, user_message)
+                if cached is not None:
+                    self._record(conversation, "assistant", cached)
+                    return cached
+
+            # Get response from ChatGPT without blocking the event loop;
+            # the semaphore caps the number of requests in flight
+            # The span includes waiting for a free slot
+            with span("openai.complete"):
+                async with self._semaphore:
+                    with OPENAI_IN_FLIGHT.track_inprogress(), OPENAI_LATENCY.labels("complete").time():
+                        response = await self.resilience.call(
+                            lambda model: self.client.chat.completions.create(
+                                messages=messages,
+                                **self._completion_params(model)
+                            )
+                        )
 
             # Extract and store response
             assistant_message = response.choices[0].message.content
-            self.conversations[chat_id].append({
-                "role": "assistant",
-                "content": assistant_message
-            })
+            self._record(conversation, "assistant", assistant_message)
+            if cacheable and assistant_message:
+                self.response_cache.set(conversation.prompt, user_message, assistant_message)
 
             return assistant_message
 
         except Exception as e:
+            ERRORS.labels("openai").inc()
             logging.error(f"Error getting ChatGPT response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now."
+            return self.ERROR_MESSAGE
+
+    async def stream_response(self, chat_id: int, user_message: str) -> AsyncIterator[str]:
+        """
+        Stream response from ChatGPT as it is generated
+
+        Args:
+            chat_id (int): Telegram chat ID
+            user_message (str): User's message
+
+        Yields:
+            str: Successive pieces of ChatGPT's response
+        """
+        parts: List[str] = []
+        try:
+            conversation, messages = await self._start_turn(chat_id, user_message)
+
+            cacheable = self._is_cacheable(conversation)
+            if cacheable:
+                cached = self.response_cache.get(conversation.prompt, user_message)
+                if cached is not None:
+                    self._record(conversation, "assistant", cached)
+                    parts.append(cached)
+                    yield cached
+                    return
+
+            with span("openai.stream"):
+                async with self._semaphore:
+                    with OPENAI_IN_FLIGHT.track_inprogress(), OPENAI_LATENCY.labels("stream").time():
+                        started = time.monotonic()
+                        # Only opening the stream is retried; a broken stream is not resent
+                        stream = await self.resilience.call(
+                            lambda model: self.client.chat.completions.create(
+                                messages=messages,
+                                stream=True,
+                                **self._completion_params(model)
+                            ),
+                            hedge=False
+                        )
+                        async for chunk in stream:
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if not delta:
+                                continue
+                            if not parts:
+                                first_token = time.monotonic() - started
+                                OPENAI_FIRST_TOKEN.observe(first_token)
+                                logging.info(f"Time to first token for chat {chat_id}: {first_token:.2f}s")
+                            parts.append(delta)
+                            yield delta
+
+            assistant_message = "".join(parts)
+            self._record(conversation, "assistant", assistant_message)
+            if cacheable and assistant_message:
+                self.response_cache.set(conversation.prompt, user_message, assistant_message)
+
+        except Exception as e:
+            ERRORS.labels("openai").inc()
+            logging.error(f"Error streaming ChatGPT response: {e}")
+            # Only apologise if the user hasn't seen part of an answer already
+            if not parts:
+                yield self.ERROR_MESSAGE
+
+    async def _start_turn(self, chat_id: int, user_message: str) -> Tuple[Conversation, List[Dict[str, str]]]:
+        """Record the user's message and build the messages to send"""
+        # Get system prompt from config
+        system_prompt = self.config_manager.instructions['prompt']
+
+        conversation = await self._get_conversation(chat_id, system_prompt)
+        self._record(conversation, "user", user_message)
+
+        # Send as much recent history as fits the token budget
+        return conversation, conversation.to_messages(self.history_token_budget)
+
+    async def _get_conversation(self, chat_id: int, system_prompt: str) -> Conversation:
+        """Get the chat's conversation, restoring it from storage if it isn't in memory"""
+        conversation = self.conversations.get(chat_id)
+
+        # First message since a restart or eviction: load the stored history lazily
+        if conversation is None and self.history_backend is not None:
+            try:
+                with span("history.load"):
+                    history = await self.history_backend.load(chat_id)
+            except Exception as e:
+                # Carry on in memory; the stored history stays for a later restore
+                logging.error(f"Error loading conversation history: {e}")
+                return self.conversations.reset(chat_id, system_prompt)
+            conversation = self.conversations.reset(chat_id, system_prompt)
+            # History written under another prompt (or before prompts were recorded) is
+            # dropped, just as a prompt change resets the conversation in memory
+            if (PROMPT_ROLE, self._prompt_hash(system_prompt)) not in history:
+                self._start_history(chat_id, system_prompt)
+                return conversation
+            for role, content in history:
+                if role == SUMMARY_ROLE:
+                    self.conversations.set_summary(conversation, content)
+                elif role != PROMPT_ROLE:
+                    self.conversations.append(conversation, role, content)
+            return conversation
+
+        if conversation is not None and conversation.prompt == system_prompt:
+            return conversation
+
+        # New conversation, or the system prompt changed and the old one is reset
+        if self.history_backend is not None:
+            self._start_history(chat_id, system_prompt)
+        return self.conversations.reset(chat_id, system_prompt)
+
+    def _start_history(self, chat_id: int, system_prompt: str) -> None:
+        """Replace a chat's stored history with an empty one written under system_prompt"""
+        self.history_backend.clear(chat_id)
+        self.history_backend.set_prompt(chat_id, self._prompt_hash(system_prompt))
+
+    @staticmethod
+    def _prompt_hash(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+
+    def _is_cacheable(self, conversation: Conversation) -> bool:
+        """Whether the current turn has little enough history to be answered from the cache"""
+        # The user's new message is already in the conversation
+        return self.response_cache is not None and len(conversation.messages) - 1 <= self.cache_max_history
+
+    def _record(self, conversation: Conversation, role: str, content: str) -> None:
+        """Add a message to the conversation and persist it"""
+        self.conversations.append(conversation, role, content)
+        if self.history_backend is not None:
+            self.history_backend.append(conversation.chat_id, role, content)
+
+    def _completion_params(self, model: str) -> Dict[str, Any]:
+        return {
+            "model": model,
+            "max_tokens": self.max_tokens,
+            "temperature": 0.7,  # Add some variability to responses
+            "presence_penalty": 0.7,  # Encourage new topics
+            "frequency_penalty": 0.6,  # Reduce repetition
+            "timeout": self.request_timeout,
+        }
 
     def reset_conversation(self, chat_id: int) -> None:
         """
@@ -98,8 +306,9 @@ class ChatGPTClient:
         Args:
             chat_id (int): Telegram chat ID to reset
         """
-        if chat_id in self.conversations:
-            self.conversations.pop(chat_id)
+        self.conversations.pop(chat_id)
+        if self.history_backend is not None:
+            self.history_backend.clear(chat_id)
 
     def get_conversation_history(self, chat_id: int) -> Optional[List[Dict[str, str]]]:
         """
@@ -111,7 +320,8 @@ class ChatGPTClient:
         Returns:
             Optional[List[Dict[str, str]]]: Conversation history or None if not found
         """
-        return self.conversations.get(chat_id)
+        conversation = self.conversations.get(chat_id)
+        return conversation.to_messages() if conversation is not None else None
 
     def change_system_prompt(self, chat_id: int, prompt_key: str) -> bool:
         """
@@ -130,11 +340,9 @@ class ChatGPTClient:
                 return False
 
             # Reset conversation and add new system prompt
-            self.reset_conversation(chat_id)
-            self.conversations[chat_id] = [{
-                "role": "system",
-                "content": new_system_prompt
-            }]
+            self.conversations.reset(chat_id, new_system_prompt)
+            if self.history_backend is not None:
+                self._start_history(chat_id, new_system_prompt)
             return True
         except Exception as e:
             logging.error(f"Error changing system prompt: {e}")
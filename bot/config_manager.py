@@ -1,23 +1,144 @@
-import pandas as pd
-from typing import Dict, Any
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Any, Optional, Tuple
 import logging
 
 
 class ConfigManager:
-    def __init__(self, config_file: str):
+    def __init__(self, config_file: str, cache_file: Optional[str] = None):
+        """
+        Load bot texts and settings from a two-column key/value Excel sheet
+
+        The sheet is compiled into a JSON cache next to it, keyed by the source's
+        modification time, size and hash, so normal startups never parse Excel.
+
+        Args:
+            config_file (str): Path to the Excel file
+            cache_file (Optional[str]): Path of the compiled cache, defaults to a hidden file next to config_file
+        """
         self.config_file = config_file
-        self.instructions: Dict[str, str] = {}
+        directory, name = os.path.split(config_file)
+        self.cache_file = cache_file or os.path.join(directory, f".{name}.cache.json")
+        self.instructions: Dict[str, Any] = {}
+        self._signature: Optional[Tuple[int, int]] = None
         self.load_config()
 
     def load_config(self) -> None:
-        """Load configuration from Excel file"""
+        """Load configuration from the compiled cache or, if it is stale, from the Excel file"""
         try:
-            messages_df = pd.read_excel(self.config_file)
-            self.instructions = dict(zip(messages_df.iloc[:, 0], messages_df.iloc[:, 1]))
+            signature = self._file_signature()
+            instructions = self._read_cache(signature)
+            if instructions is None:
+                instructions = self._read_sheet()
+                self._write_cache(signature, instructions)
+
+            # Swap in a complete new dict so readers never see a half-loaded config
+            self.instructions = instructions
+            self._signature = signature
 
         except Exception as e:
             logging.error(f"Error loading configuration: {e}")
             raise
 
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the configuration if the Excel file changed since it was loaded
+
+        Returns:
+            bool: True if a new configuration was loaded
+        """
+        try:
+            if self._file_signature() == self._signature:
+                return False
+        except OSError as e:
+            logging.error(f"Error checking configuration file: {e}")
+            return False
+
+        try:
+            self.load_config()
+        except Exception:
+            # Keep serving the previous configuration
+            return False
+        logging.info(f"Configuration reloaded from {self.config_file}")
+        return True
+
+    async def watch(self, interval: float = 5.0) -> None:
+        """Poll the Excel file every interval seconds and hot-reload it when it changes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.reload_if_changed)
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.config_file)
+        return stat.st_mtime_ns, stat.st_size
 
+    def _file_hash(self) -> str:
+        with open(self.config_file, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
 
+    def _read_cache(self, signature: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """Return cached instructions if they were compiled from the current file"""
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if [cache.get("mtime_ns"), cache.get("size")] == list(signature):
+            return cache["instructions"]
+
+        # The file was touched (e.g. by a checkout) but may be unchanged
+        if cache.get("sha256") == self._file_hash():
+            self._write_cache(signature, cache["instructions"])
+            return cache["instructions"]
+        return None
+
+    def _write_cache(self, signature: Tuple[int, int], instructions: Dict[str, Any]) -> None:
+        cache = {
+            "mtime_ns": signature[0],
+            "size": signature[1],
+            "sha256": self._file_hash(),
+            "instructions": instructions,
+        }
+        tmp_file = None
+        try:
+            # A unique temporary file, as several worker processes may write the cache at once
+            fd, tmp_file = tempfile.mkstemp(
+                prefix=f"{os.path.basename(self.cache_file)}.",
+                suffix=".tmp",
+                dir=os.path.dirname(self.cache_file) or "."
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not write configuration cache {self.cache_file}: {e}")
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    @staticmethod
+    def _plain_value(value: Any) -> Any:
+        """Keep JSON types as they are and turn other cell values (e.g. dates) into text"""
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return str(value)
+
+    def _read_sheet(self) -> Dict[str, Any]:
+        """Parse the first sheet: the first row is a header, then one key/value pair per row"""
+        # Imported lazily, only needed when the cache is stale
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.config_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(min_row=2, max_col=2, values_only=True)
+            return {
+                str(key): self._plain_value(value)
+                for key, value in (tuple(row) + (None,) * (2 - len(row)) for row in rows)
+                if key is not None
+            }
+        finally:
+            workbook.close()
@@ -0,0 +1,246 @@
+import time
+from itertools import islice
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Sequence
+from .tokenizer import TokenCounter
+
+
+# Introduces the running summary of turns that left the window
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+class Conversation:
+    """History of a single chat: a shared system message plus a bounded window of turns"""
+
+    __slots__ = ("chat_id", "system", "system_tokens", "messages", "tokens", "chars", "last_used",
+                 "summary", "summary_tokens", "overflow")
+
+    def __init__(self, chat_id: int, system: Dict[str, str], system_tokens: int, max_messages: int):
+        self.chat_id = chat_id
+        # Shared with every other conversation using the same prompt, never copied
+        self.system = system
+        self.system_tokens = system_tokens
+        # A bounded deque drops the oldest turn on append, so trimming never copies the history
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        # Token count of each message, computed once when the message is added
+        self.tokens: Deque[int] = deque(maxlen=max_messages)
+        self.chars = 0
+        self.last_used = time.monotonic()
+        # Running summary of older turns, sent after the system message
+        self.summary: Optional[Dict[str, str]] = None
+        self.summary_tokens = 0
+        # Turns that left the window and are not summarized yet (only kept when summarizing)
+        self.overflow: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+
+    @property
+    def prompt(self) -> str:
+        return self.system["content"]
+
+    def to_messages(self, token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Build the message list for the API; message dicts are shared, not copied
+
+        Args:
+            token_budget (Optional[int]): Tokens available for the system prompt and
+                history. The newest messages that fit are kept; the latest message
+                is always included.
+
+        Returns:
+            List[Dict[str, str]]: System message and summary followed by the selected history
+        """
+        head = [self.system] if self.summary is None else [self.system, self.summary]
+        if token_budget is None:
+            return [*head, *self.messages]
+
+        remaining = token_budget - self.system_tokens - self.summary_tokens
+        keep = 0
+        for tokens in reversed(self.tokens):
+            if keep and tokens > remaining:
+                break
+            remaining -= tokens
+            keep += 1
+
+        if keep == len(self.messages):
+            return [*head, *self.messages]
+        return [*head, *islice(self.messages, len(self.messages) - keep, None)]
+
+
+class ConversationStore:
+    def __init__(
+            self,
+            max_messages: int = 8,
+            max_conversations: int = 10000,
+            max_chars: int = 20_000_000,
+            idle_ttl: float = 86400,
+            token_counter: Optional[TokenCounter] = None,
+            summarize: bool = False
+    ):
+        """
+        In-memory conversation histories with LRU, idle-time and memory-budget eviction
+
+        Args:
+            max_messages (int): Number of user/assistant messages kept per chat
+            max_conversations (int): Maximum number of chats kept in memory
+            max_chars (int): Budget for the total length of all stored messages
+            idle_ttl (float): Seconds after which an unused conversation is dropped
+            token_counter (Optional[TokenCounter]): Counter used to cache per-message token counts
+            summarize (bool): Keep turns leaving the window until they are summarized
+        """
+        self.max_messages = max_messages
+        self.max_conversations = max_conversations
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self.token_counter = token_counter or TokenCounter("gpt-3.5-turbo")
+        self.summarize = summarize
+        self._conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._system: Optional[Dict[str, str]] = None
+        self._system_tokens = 0
+        self.total_chars = 0
+        self.evictions = 0
+
+    def _system_message(self, prompt: str) -> Dict[str, str]:
+        """Return the shared system message for a prompt, creating it when the prompt changes"""
+        if self._system is None or (self._system["content"] is not prompt
+                                    and self._system["content"] != prompt):
+            self._system = {"role": "system", "content": prompt}
+            self._system_tokens = self.token_counter.count_message(prompt)
+        return self._system
+
+    def get(self, chat_id: int) -> Optional[Conversation]:
+        """
+        Get a chat's conversation and mark it as recently used
+
+        Args:
+            chat_id (int): Telegram chat ID
+
+        Returns:
+            Optional[Conversation]: Conversation or None if not stored
+        """
+        conversation = self._conversations.get(chat_id)
+        if conversation is not None:
+            conversation.last_used = time.monotonic()
+            self._conversations.move_to_end(chat_id)
+        return conversation
+
+    def peek(self, chat_id: int) -> Optional[Conversation]:
+        """Get a chat's conversation without marking it as used"""
+        return self._conversations.get(chat_id)
+
+    def get_or_create(self, chat_id: int, prompt: str) -> Conversation:
+        """
+        Get a chat's conversation, starting a new one if none exists or its prompt changed
+
+        Args:
+            chat_id (int): Telegram chat ID
+            prompt (str): Current system prompt
+
+        Returns:
+            Conversation: Conversation for the chat
+        """
+        conversation = self.get(chat_id)
+        if conversation is not None and (conversation.prompt is prompt or conversation.prompt == prompt):
+            return conversation
+        return self.reset(chat_id, prompt)
+
+    def reset(self, chat_id: int, prompt: str) -> Conversation:
+        """Replace a chat's conversation with an empty one using the given prompt"""
+        self.evict_idle()
+        self.pop(chat_id)
+        system = self._system_message(prompt)
+        conversation = Conversation(chat_id, system, self._system_tokens, self.max_messages)
+        self._conversations[chat_id] = conversation
+        while len(self._conversations) > self.max_conversations:
+            self._evict_oldest()
+        return conversation
+
+    def append(self, conversation: Conversation, role: str, content: str) -> None:
+        """
+        Append a message to a conversation, dropping the oldest one past the window
+
+        Args:
+            conversation (Conversation): Target conversation
+            role (str): Message role
+            content (str): Message text
+        """
+        stored = self._conversations.get(conversation.chat_id) is conversation
+        messages = conversation.messages
+        delta = len(content)
+        if len(messages) == messages.maxlen:
+            leaving = messages[0]
+            if self.summarize:
+                # The oldest unsummarized turn is lost if the summarizer falls behind
+                overflow = conversation.overflow
+                if len(overflow) == overflow.maxlen:
+                    delta -= len(overflow[0]["content"])
+                overflow.append(leaving)
+            else:
+                delta -= len(leaving["content"])
+        messages.append({"role": role, "content": content})
+        conversation.tokens.append(self.token_counter.count_message(content))
+        conversation.chars += delta
+        conversation.last_used = time.monotonic()
+
+        # The conversation may have been evicted while a reply was generated
+        if stored:
+            self._conversations.move_to_end(conversation.chat_id)
+            self._add_chars(delta)
+
+    def set_summary(self, conversation: Conversation, summary: str,
+                    summarized: Sequence[Dict[str, str]] = ()) -> None:
+        """
+        Replace a conversation's running summary
+
+        Args:
+            conversation (Conversation): Target conversation
+            summary (str): New summary, covering the previous summary and the summarized turns
+            summarized (Sequence[Dict[str, str]]): Overflow turns the summary covers, dropped from memory
+        """
+        delta = len(summary) - (len(conversation.summary["content"]) - len(SUMMARY_PREFIX)
+                                if conversation.summary is not None else 0)
+        covered = {id(message) for message in summarized}
+        overflow = conversation.overflow
+        while overflow and id(overflow[0]) in covered:
+            delta -= len(overflow.popleft()["content"])
+
+        content = SUMMARY_PREFIX + summary
+        conversation.summary = {"role": "system", "content": content}
+        conversation.summary_tokens = self.token_counter.count_message(content)
+        conversation.chars += delta
+        if self._conversations.get(conversation.chat_id) is conversation:
+            self._add_chars(delta)
+
+    def _add_chars(self, delta: int) -> None:
+        self.total_chars += delta
+        while self.total_chars > self.max_chars and len(self._conversations) > 1:
+            self._evict_oldest()
+
+    def pop(self, chat_id: int) -> Optional[Conversation]:
+        """Remove and return a chat's conversation"""
+        conversation = self._conversations.pop(chat_id, None)
+        if conversation is not None:
+            self.total_chars -= conversation.chars
+        return conversation
+
+    def evict_idle(self) -> None:
+        """Drop conversations unused for longer than idle_ttl"""
+        deadline = time.monotonic() - self.idle_ttl
+        # Entries are kept in least-recently-used order, so only the head needs checking
+        while self._conversations:
+            oldest = next(iter(self._conversations.values()))
+            if oldest.last_used >= deadline:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        chat_id = next(iter(self._conversations))
+        self.pop(chat_id)
+        self.evictions += 1
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._conversations
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._conversations)
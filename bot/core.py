@@ -1,9 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from .handlers import MessageHandlers
 from .message_sender import MessageSender
 from .chatgpt_client import ChatGPTClient
+from .conversation_store import ConversationStore
+from .tokenizer import TokenCounter
+from .history_backend import HistoryBackend, SQLiteHistoryBackend, MySQLHistoryBackend
+from .database import AsyncDatabasePool
+from .cache import ResponseCache
+from .resilience import CircuitBreaker, ResilientCaller
+from .metrics import start_metrics_server
 from .config_manager import ConfigManager
 from .user_manager import UserManager
+from .broadcast import Broadcaster
+from .summarizer import ConversationSummarizer
+from .update_processor import BackpressureQueue, ChatOrderedUpdateProcessor
+from config import (
+    METRICS_PORT,
+    METRICS_ADDR,
+    CONFIG_RELOAD_INTERVAL,
+    TELEGRAM_MODE,
+    TELEGRAM_BASE_URL,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_WARM_CONNECTIONS,
+    UPDATE_QUEUE_SIZE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    OPENAI_BASE_URL,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_TIMEOUT,
+    OPENAI_MODEL,
+    OPENAI_MAX_TOKENS,
+    OPENAI_POOL_SIZE,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_WARM_CONNECTIONS,
+    CONTEXT_TOKEN_BUDGET,
+    OPENAI_MAX_RETRIES,
+    OPENAI_DEADLINE,
+    OPENAI_HEDGE,
+    OPENAI_HEDGE_MIN_DELAY,
+    OPENAI_HEDGE_BUDGET,
+    OPENAI_BREAKER_FAILURES,
+    OPENAI_BREAKER_RESET,
+    OPENAI_FALLBACK_MODEL,
+    HISTORY_MAX_MESSAGES,
+    CONVERSATION_MAX_CHATS,
+    CONVERSATION_MAX_CHARS,
+    CONVERSATION_IDLE_TTL,
+    CONVERSATION_SUMMARY,
+    SUMMARY_MODEL,
+    SUMMARY_MIN_MESSAGES,
+    SUMMARY_RATE,
+    SUMMARY_MAX_TOKENS,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_HISTORY,
+    HISTORY_BACKEND,
+    HISTORY_SQLITE_PATH,
+    HISTORY_FLUSH_INTERVAL,
+    STREAM_REPLIES,
+    STREAM_EDIT_INTERVAL,
+    FORMAT_REPLIES,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    SEND_WORKERS,
+    SEND_MAX_RETRIES,
+    CHAT_MESSAGE_RATE,
+    CHAT_MESSAGE_BURST,
+    MESSAGE_DEBOUNCE,
+    MAX_PENDING_TURNS,
+    MAX_CONCURRENT_UPDATES,
+    MAX_PENDING_UPDATES,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    USER_INSERT_BATCH_SIZE,
+    USER_INSERT_BATCH_DELAY,
+    BROADCAST_PAGE_SIZE,
+    BROADCAST_REPORT_INTERVAL,
+    PROFILE_MAX_SECONDS,
+)
 
 
 class TelegramBot:
@@ -11,28 +93,152 @@ class TelegramBot:
             self,
             telegram_token: str,
             openai_api_key: str,
-            config_file: str
+            config_file: str,
+            metrics_port: int = METRICS_PORT,
+            send_rate_share: float = 1.0
     ):
-        """Initialize the bot with all components"""
-        self.app = Application.builder().token(telegram_token).build()
+        """
+        Initialize the bot with all components
+
+        Args:
+            telegram_token (str): Telegram bot token
+            openai_api_key (str): OpenAI API key
+            config_file (str): Path to the Excel configuration
+            metrics_port (int): Port of the metrics endpoint (0 disables it)
+            send_rate_share (float): Share of TELEGRAM_GLOBAL_RATE this process may use,
+                when several processes send for the same bot
+        """
+        self.metrics_port = metrics_port
+        # Set once startup warm-up has finished
+        self.ready = False
+        self.update_processor = ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES)
+        builder = (
+            Application.builder()
+            .token(telegram_token)
+            # The application turns every update it takes from the queue into a task at
+            # once, so the queue only hands out updates while the processor's backlog has
+            # room; past that it fills up and holds up the receiver
+            .update_queue(BackpressureQueue(self.update_processor, maxsize=UPDATE_QUEUE_SIZE))
+            .concurrent_updates(self.update_processor)
+            # Connections are kept alive and reused, so size the pool for the busiest bursts
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+            .post_shutdown(self._post_shutdown)
+        )
+        if TELEGRAM_BASE_URL:
+            builder = builder.base_url(TELEGRAM_BASE_URL)
+        self.app = builder.build()
+        self._background_tasks: List[asyncio.Task] = []
         self.config_manager = ConfigManager(config_file)
-        self.message_sender = MessageSender(self.app.bot)
-        self.chatgpt_client = ChatGPTClient(openai_api_key, self.config_manager)
-        self.user_manager = UserManager()
+        self.message_sender = MessageSender(
+            self.app.bot,
+            edit_interval=STREAM_EDIT_INTERVAL,
+            global_rate=TELEGRAM_GLOBAL_RATE * send_rate_share,
+            chat_rate=TELEGRAM_CHAT_RATE,
+            chat_burst=TELEGRAM_CHAT_BURST,
+            workers=SEND_WORKERS,
+            max_retries=SEND_MAX_RETRIES
+        )
+        self.history_backend = self._create_history_backend()
+        self.chatgpt_client = ChatGPTClient(
+            openai_api_key,
+            self.config_manager,
+            max_concurrency=OPENAI_MAX_CONCURRENCY,
+            request_timeout=OPENAI_TIMEOUT,
+            base_url=OPENAI_BASE_URL,
+            pool_size=OPENAI_POOL_SIZE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            conversation_store=ConversationStore(
+                max_messages=HISTORY_MAX_MESSAGES,
+                max_conversations=CONVERSATION_MAX_CHATS,
+                max_chars=CONVERSATION_MAX_CHARS,
+                idle_ttl=CONVERSATION_IDLE_TTL,
+                token_counter=TokenCounter(OPENAI_MODEL),
+                summarize=CONVERSATION_SUMMARY
+            ),
+            model=OPENAI_MODEL,
+            max_tokens=OPENAI_MAX_TOKENS,
+            context_token_budget=CONTEXT_TOKEN_BUDGET,
+            history_backend=self.history_backend,
+            response_cache=(
+                ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL) if RESPONSE_CACHE_SIZE > 0 else None
+            ),
+            cache_max_history=RESPONSE_CACHE_MAX_HISTORY,
+            resilience=ResilientCaller(
+                OPENAI_MODEL,
+                fallback_model=OPENAI_FALLBACK_MODEL,
+                max_retries=OPENAI_MAX_RETRIES,
+                deadline=OPENAI_DEADLINE,
+                hedge=OPENAI_HEDGE,
+                hedge_min_delay=OPENAI_HEDGE_MIN_DELAY,
+                hedge_budget=OPENAI_HEDGE_BUDGET,
+                breaker=CircuitBreaker(OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RESET)
+            )
+        )
+        self.summarizer = ConversationSummarizer(
+            self.chatgpt_client.client,
+            self.chatgpt_client.conversations,
+            SUMMARY_MODEL,
+            history_backend=self.history_backend,
+            min_messages=SUMMARY_MIN_MESSAGES,
+            rate=SUMMARY_RATE,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            request_timeout=OPENAI_TIMEOUT
+        ) if CONVERSATION_SUMMARY else None
+        self.user_manager = UserManager(
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_cache_ttl=PROFILE_CACHE_TTL,
+            insert_batch_size=USER_INSERT_BATCH_SIZE,
+            insert_batch_delay=USER_INSERT_BATCH_DELAY
+        )
+        # Users who blocked the bot are skipped by broadcasts until they /start again
+        self.message_sender.on_forbidden = lambda chat_id: self.user_manager.mark_blocked([chat_id])
+        self.broadcaster = Broadcaster(
+            self.message_sender,
+            self.user_manager,
+            page_size=BROADCAST_PAGE_SIZE,
+            report_interval=BROADCAST_REPORT_INTERVAL
+        )
         self.handlers = MessageHandlers(
             self.message_sender,
             self.chatgpt_client,
             self.config_manager,
-            self.user_manager
+            self.user_manager,
+            stream_replies=STREAM_REPLIES,
+            format_replies=FORMAT_REPLIES,
+            message_rate=CHAT_MESSAGE_RATE,
+            message_burst=CHAT_MESSAGE_BURST,
+            debounce=MESSAGE_DEBOUNCE,
+            max_pending_turns=MAX_PENDING_TURNS,
+            broadcaster=self.broadcaster,
+            summarizer=self.summarizer,
+            profile_max_seconds=PROFILE_MAX_SECONDS
         )
 
         self._setup_handlers()
 
+    @staticmethod
+    def _create_history_backend() -> Optional[HistoryBackend]:
+        """Create the configured persistent conversation storage"""
+        options = {"max_messages": HISTORY_MAX_MESSAGES, "flush_interval": HISTORY_FLUSH_INTERVAL}
+        if HISTORY_BACKEND == "sqlite":
+            return SQLiteHistoryBackend(HISTORY_SQLITE_PATH, **options)
+        if HISTORY_BACKEND == "mysql":
+            return MySQLHistoryBackend(AsyncDatabasePool.get_instance(), **options)
+        return None
+
     def _setup_handlers(self) -> None:
         """Set up all message handlers"""
         # Command handler for /start
         self.app.add_handler(CommandHandler("start", self.handlers.start_command))
 
+        # Admin commands
+        self.app.add_handler(CommandHandler("broadcast", self.handlers.broadcast_command))
+        self.app.add_handler(CommandHandler("cancel_broadcast", self.handlers.cancel_broadcast_command))
+        self.app.add_handler(CommandHandler("profile", self.handlers.profile_command))
+        self.app.add_handler(CommandHandler("trace", self.handlers.trace_command))
+
         # Contact message handler
         self.app.add_handler(MessageHandler(
             filters.CONTACT,
@@ -45,6 +251,141 @@ class TelegramBot:
             self.handlers.handle_message
         ))
 
+    async def _post_init(self, application: Application) -> None:
+        """Start background tasks once the application is initialized"""
+        if self.metrics_port:
+            start_metrics_server(self, self.metrics_port, METRICS_ADDR)
+            logging.info(f"Serving metrics on {METRICS_ADDR}:{self.metrics_port}")
+        if self.history_backend is not None:
+            await self.history_backend.start()
+        if self.summarizer is not None:
+            self.summarizer.start()
+        if CONFIG_RELOAD_INTERVAL > 0:
+            self._background_tasks.append(
+                asyncio.create_task(self.config_manager.watch(CONFIG_RELOAD_INTERVAL))
+            )
+        await self._warm_up()
+        await self.broadcaster.resume()
+
+    async def _warm_up(self) -> None:
+        """
+        Open connections to Telegram, OpenAI and MySQL before the first update
+
+        Raises:
+            RuntimeError: If database tables or columns the bot relies on are missing
+        """
+        started = time.monotonic()
+        schema = {**UserManager.SCHEMA, **Broadcaster.SCHEMA}
+        if isinstance(self.history_backend, MySQLHistoryBackend):
+            schema.update(MySQLHistoryBackend.SCHEMA)
+        missing = await self.user_manager.db.missing_schema(schema)
+        if missing:
+            raise RuntimeError(f"Database schema is missing: {', '.join(missing)}")
+
+        telegram, openai, database = await asyncio.gather(
+            self._warm_up_telegram(TELEGRAM_WARM_CONNECTIONS),
+            self.chatgpt_client.warm_up(OPENAI_WARM_CONNECTIONS),
+            self.user_manager.db.warm_up()
+        )
+        failed = [name for name, ok in (("Telegram", telegram), ("OpenAI", openai), ("MySQL", database)) if not ok]
+        if failed:
+            logging.warning(f"Warm-up failed for {', '.join(failed)}; connecting on demand")
+        self.ready = True
+        logging.info(f"Bot ready after {time.monotonic() - started:.2f}s warm-up")
+
+    async def _warm_up_telegram(self, connections: int) -> bool:
+        results = await asyncio.gather(
+            *(self.app.bot.get_me() for _ in range(max(1, connections))),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logging.error(f"Telegram warm-up failed on {len(errors)}/{len(results)} connections: {errors[0]}")
+        return not errors
+
+    async def _post_stop(self, application: Application) -> None:
+        """Stop background tasks and deliver queued outgoing messages while the bot can still send"""
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+        # Checkpoint broadcasts and answer messages that were already admitted
+        # before the sender drains its queue
+        await self.broadcaster.stop()
+        await self.handlers.coalescer.stop()
+        if self.summarizer is not None:
+            await self.summarizer.stop()
+        await self.message_sender.stop()
+        if self.history_backend is not None:
+            await self.history_backend.close()
+
+    async def _post_shutdown(self, application: Application) -> None:
+        """Release resources once the application has stopped"""
+        self.user_manager.db.close()
+
+    async def start(self) -> None:
+        """
+        Start the bot inside a running event loop without receiving updates itself
+
+        The caller feeds updates into app.update_queue (e.g. benchmarks or a
+        sharding supervisor). Pair with stop().
+        """
+        await self.app.initialize()
+        await self._post_init(self.app)
+        await self.app.start()
+
+    async def stop(self) -> None:
+        """Stop a bot started with start(), handling already queued updates first"""
+        await self.app.stop()
+        await self._post_stop(self.app)
+        await self.app.shutdown()
+        await self._post_shutdown(self.app)
+
+    async def release_chats(self, owns: Callable[[int], bool]) -> int:
+        """
+        Forget in-memory state of chats this process no longer serves
+
+        Used by sharding workers when chats move to another worker, so that
+        if they move back later, their history is loaded from storage rather
+        than served from a stale copy. Buffered history writes are flushed for
+        the new owner to load.
+
+        Args:
+            owns (Callable[[int], bool]): Whether a chat ID is still served by this process
+
+        Returns:
+            int: Number of conversations dropped
+        """
+        conversations = self.chatgpt_client.conversations
+        released = [chat_id for chat_id in conversations if not owns(chat_id)]
+        for chat_id in released:
+            conversations.pop(chat_id)
+        profile_cache = self.user_manager.profile_cache
+        for chat_id in profile_cache:
+            if not owns(chat_id):
+                profile_cache.invalidate(chat_id)
+        if self.history_backend is not None:
+            await self.history_backend.flush()
+        return len(released)
+
     def run(self) -> None:
-        """Run the bot"""
-        self.app.run_polling()
\ No newline at end of file
+        """
+        Run the bot until interrupted
+
+        In webhook mode updates are received by a local HTTP server that checks
+        Telegram's secret token header. On shutdown the server stops accepting
+        updates and the ones already queued are processed before exit.
+        """
+        if TELEGRAM_MODE == "webhook":
+            if not WEBHOOK_URL or not WEBHOOK_SECRET:
+                raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+            logging.info(f"Receiving updates via webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+            self.app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET
+            )
+        else:
+            self.app.run_polling()
\ No newline at end of file
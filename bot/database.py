@@ -1,8 +1,15 @@
+import asyncio
+import threading
 import mysql.connector
 from mysql.connector import pooling
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
 import logging
-from config import DB_CONFIG
+import time
+from .metrics import DB_QUERY_LATENCY, ERRORS
+from config import DB_CONFIG, DB_POOL_SIZE, DB_ACQUIRE_TIMEOUT
+
+T = TypeVar("T")
 
 
 class DatabasePool:
@@ -20,12 +27,154 @@ class DatabasePool:
             try:
                 DatabasePool._pool = mysql.connector.pooling.MySQLConnectionPool(
                     pool_name="mypool",
-                    pool_size=5,
+                    pool_size=DB_POOL_SIZE,
                     **DB_CONFIG
                 )
             except Exception as e:
                 logging.error(f"Error creating connection pool: {e}")
                 raise
 
+    @property
+    def pool_size(self) -> int:
+        return DatabasePool._pool.pool_size
+
     def get_connection(self):
         return DatabasePool._pool.get_connection()
+
+
+class AsyncDatabasePool:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = AsyncDatabasePool(DatabasePool.get_instance())
+        return cls._instance
+
+    def __init__(self, pool: DatabasePool, acquire_timeout: float = DB_ACQUIRE_TIMEOUT):
+        """
+        Run blocking mysql.connector work off the event loop
+
+        Each call checks out a pooled connection on a dedicated executor thread.
+        The executor has exactly one thread per pooled connection, so a checkout
+        never finds the pool exhausted, and callers wait for a free slot on the
+        event loop instead of blocking it.
+
+        Args:
+            pool (DatabasePool): Underlying synchronous connection pool
+            acquire_timeout (float): Seconds to wait for a free connection
+        """
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool.pool_size,
+            thread_name_prefix="db"
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Call func(conn, *args) with a healthy pooled connection
+
+        Args:
+            func (Callable): Blocking function receiving the connection as first argument
+            *args: Extra arguments for func
+
+        Returns:
+            The value returned by func
+
+        Raises:
+            asyncio.TimeoutError: If no connection frees up within acquire_timeout
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool.pool_size)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self._call, func, args)
+            finally:
+                self._slots.release()
+        except Exception:
+            ERRORS.labels("db").inc()
+            raise
+        finally:
+            # Labelled by the query function, e.g. "has_complete_profile"
+            DB_QUERY_LATENCY.labels(func.__name__.lstrip("_")).observe(time.perf_counter() - started)
+
+    def _call(self, func: Callable[..., T], args: tuple) -> T:
+        with self.pool.get_connection() as conn:
+            # Health check on checkout: transparently replace connections
+            # the server dropped while they sat idle in the pool
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            return func(conn, *args)
+
+    async def warm_up(self, timeout: float = 5.0) -> bool:
+        """
+        Check out and ping every pooled connection at once before the first request
+
+        Replaces connections that went stale and starts all executor threads.
+
+        Args:
+            timeout (float): Seconds to wait for all connections to be checked out together
+
+        Returns:
+            bool: True if every connection is healthy
+        """
+        # Each call holds its connection until all have one, so every pooled connection is used
+        barrier = threading.Barrier(self.pool.pool_size, timeout=timeout)
+        results = await asyncio.gather(
+            *(self.run(self._warm_up_connection, barrier) for _ in range(self.pool.pool_size)),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logging.error(f"Database warm-up failed on {len(errors)}/{len(results)} connections: {errors[0]}")
+        return not errors
+
+    @staticmethod
+    def _warm_up_connection(conn, barrier: threading.Barrier) -> None:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        barrier.wait()
+
+    async def missing_schema(self, schema: Dict[str, Iterable[str]]) -> List[str]:
+        """
+        Check that tables have the expected columns
+
+        Args:
+            schema (Dict[str, Iterable[str]]): Column names by table name
+
+        Returns:
+            List[str]: Missing "table" or "table.column" names
+        """
+        return await self.run(self._missing_schema, schema)
+
+    @staticmethod
+    def _missing_schema(conn, schema: Dict[str, Iterable[str]]) -> List[str]:
+        cursor = conn.cursor()
+        tables = list(schema)
+        cursor.execute(f"""
+            SELECT TABLE_NAME, COLUMN_NAME
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))})
+        """, tables)
+        existing: Dict[str, set] = {}
+        for table, column in cursor.fetchall():
+            existing.setdefault(table, set()).add(column)
+
+        missing = []
+        for table, columns in schema.items():
+            if table not in existing:
+                missing.append(table)
+                continue
+            missing.extend(f"{table}.{column}" for column in columns if column not in existing[table])
+        return missing
+
+    def close(self) -> None:
+        """Stop the executor threads"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,153 @@
+import html
+import re
+from typing import List, Optional, Tuple
+
+# Telegram's limit on message text, in UTF-16 code units after entity parsing
+MAX_MESSAGE_LENGTH = 4096
+
+FENCE = "```"
+_SENTENCE_END = re.compile(r"[.!?…][)\"»”']*\s")
+_FENCED_BLOCK = re.compile(r"```[^\n`]*\n?(.*?)(?:```|\Z)", re.S)
+_INLINE_CODE = re.compile(r"`([^`\n]+)`")
+_LINK = re.compile(r"\[([^\]\n]+)\]\((https?://[^)\s]+)\)")
+# Bare URL, without trailing punctuation or emphasis markers; also matches link targets once converted
+_URL = re.compile(r"https?://[^\s<>\"]*[^\s<>\"*_~.,;:!?)']")
+# "__" must not touch a word, a dot or a call, so identifiers such as __init__ stay as is
+_BOLD = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|(?<![\w.])__(?=\S)(.+?)(?<=\S)__(?![\w(])", re.S)
+_ITALIC = re.compile(r"(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?![\w*])|(?<![\w_])_(?=\S)([^_\n]+?)(?<=\S)_(?![\w_])")
+_STRIKE = re.compile(r"~~(?=\S)(.+?)(?<=\S)~~")
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*$", re.M)
+_BULLET = re.compile(r"^(\s*)[*-]\s+", re.M)
+
+
+def text_length(text: str) -> int:
+    """Length of text as Telegram counts it (UTF-16 code units)"""
+    return len(text) + sum(1 for ch in text if ord(ch) > 0xFFFF)
+
+
+def _fit(text: str, limit: int) -> int:
+    """Number of leading characters of text that fit within limit UTF-16 code units"""
+    if len(text) * 2 <= limit or text_length(text) <= limit:
+        return len(text)
+    units = 0
+    for index, ch in enumerate(text):
+        units += 2 if ord(ch) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def _cut_point(window: str) -> int:
+    """Best place to end a chunk: paragraph, line, sentence, word, in that order"""
+    minimum = len(window) // 2
+    for separator in ("\n\n", "\n"):
+        index = window.rfind(separator)
+        if index >= minimum:
+            return index
+    sentences = [match.end() for match in _SENTENCE_END.finditer(window, minimum)]
+    if sentences:
+        return sentences[-1]
+    index = window.rfind(" ")
+    if index >= minimum:
+        return index
+    return len(window)
+
+
+def split_head(text: str, limit: int = MAX_MESSAGE_LENGTH, markdown: bool = False) -> Tuple[str, str]:
+    """
+    Take the first chunk of text that fits in one message
+
+    The chunk ends at the last paragraph break, line break, sentence end or
+    space within the limit, and is hard-split only if there is none. With
+    markdown, a code block cut in two is closed at the end of the chunk and
+    reopened at the start of the rest.
+
+    Args:
+        text (str): Text to split
+        limit (int): Maximum chunk length in UTF-16 code units
+        markdown (bool): Whether text is Markdown
+
+    Returns:
+        Tuple[str, str]: The chunk and the remaining text ("" if all of it fit)
+    """
+    if text_length(text) <= limit:
+        return text, ""
+
+    # Leave room for closing and reopening a code block
+    reserve = len(FENCE) + 1 if markdown else 0
+    window = text[:_fit(text, limit - reserve)]
+    cut = _cut_point(window)
+    head, rest = text[:cut].rstrip(), text[cut:].lstrip()
+    if markdown and head.count(FENCE) % 2:
+        head += "\n" + FENCE
+        rest = FENCE + "\n" + rest
+    return head, rest
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH, markdown: bool = False) -> List[str]:
+    """
+    Split text into chunks that each fit in one message, at natural boundaries
+
+    Args:
+        text (str): Text to split
+        limit (int): Maximum chunk length in UTF-16 code units
+        markdown (bool): Whether text is Markdown, keeping code blocks intact per chunk
+
+    Returns:
+        List[str]: Non-empty chunks in order
+    """
+    chunks = []
+    while text:
+        head, text = split_head(text, limit, markdown)
+        if head.strip():
+            chunks.append(head)
+    return chunks
+
+
+def _inline_to_html(text: str) -> str:
+    """Convert inline Markdown (outside code blocks) to Telegram HTML"""
+    # Code and URLs are set aside so emphasis markers inside them stay as they are
+    kept: List[str] = []
+
+    def keep(html_text: str) -> str:
+        kept.append(html_text)
+        return f"\x00{len(kept) - 1}\x00"
+
+    text = _INLINE_CODE.sub(lambda m: keep(f"<code>{html.escape(m.group(1), quote=False)}</code>"), text)
+    text = html.escape(text, quote=False)
+    # Already escaped above, apart from quotes that would end the attribute
+    text = _LINK.sub(lambda m: f'<a href="{m.group(2).replace(chr(34), "&quot;")}">{m.group(1)}</a>', text)
+    text = _URL.sub(lambda m: keep(m.group(0)), text)
+    text = _HEADING.sub(r"<b>\1</b>", text)
+    text = _BULLET.sub(r"\1• ", text)
+    text = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = _ITALIC.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    text = _STRIKE.sub(r"<s>\1</s>", text)
+    return re.sub("\x00(\\d+)\x00", lambda m: kept[int(m.group(1))], text)
+
+
+def markdown_to_html(text: str) -> Optional[str]:
+    """
+    Convert the Markdown produced by ChatGPT to Telegram's HTML formatting
+
+    Handles code blocks, inline code, bold, italic, strikethrough, links,
+    headings and bullet lists; everything else is escaped and shown as is.
+
+    Args:
+        text (str): Markdown text
+
+    Returns:
+        Optional[str]: HTML text, or None if the text has no formatting and can be sent as is
+    """
+    parts = []
+    position = 0
+    for match in _FENCED_BLOCK.finditer(text):
+        parts.append(_inline_to_html(text[position:match.start()]))
+        code = match.group(1).rstrip("\n")
+        parts.append(f"<pre><code>{html.escape(code, quote=False)}</code></pre>")
+        position = match.end()
+    parts.append(_inline_to_html(text[position:]))
+    result = "".join(parts)
+    if result == html.escape(text, quote=False):
+        return None
+    return result
@@ -1,42 +1,158 @@
+import asyncio
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from telegram.ext import ContextTypes
+from .admission import MessageCoalescer
+from .broadcast import BroadcastError
+from .metrics import timed, HANDLER_LATENCY, HANDLERS_IN_FLIGHT
+from .profiler import SamplingProfiler
+from .tracing import tracer, traced, span
+
+
+# Used when the config sheet has no "slow_down" text
+SLOW_DOWN_MESSAGE = "You're sending messages too quickly. Please wait a moment before sending more."
 
 
 class MessageHandlers:
-    def __init__(self, message_sender, chatgpt_client, config_manager, user_manager):
+    def __init__(self, message_sender, chatgpt_client, config_manager, user_manager,
+                 stream_replies: bool = False, format_replies: bool = True, message_rate: float = 1.0, message_burst: float = 20,
+                 debounce: float = 1.0, max_pending_turns: int = 200, broadcaster=None, summarizer=None,
+                 profile_max_seconds: float = 60):
         self.message_sender = message_sender
         self.chatgpt_client = chatgpt_client
         self.config_manager = config_manager
         self.user_manager = user_manager
+        self.broadcaster = broadcaster
+        self.summarizer = summarizer
+        self.profiler = SamplingProfiler()
+        self.profile_max_seconds = profile_max_seconds
+        self.stream_replies = stream_replies
+        self.format_replies = format_replies
+        # Replies are produced per chat in the background, from merged messages
+        self.coalescer = MessageCoalescer(
+            self._reply,
+            rate=message_rate,
+            burst=message_burst,
+            debounce=debounce,
+            max_chats=max_pending_turns
+        )
 
+    @timed(HANDLER_LATENCY.labels("start"), HANDLERS_IN_FLIGHT)
+    @traced("start")
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle the /start command"""
         chat_id = update.effective_chat.id
         username = update.message.from_user.username if update.message.from_user else None
 
         # Initialize user in database
-        self.user_manager.initialize_user(chat_id, username)
+        with span("db.initialize_user"):
+            await self.user_manager.initialize_user(chat_id, username)
 
         # Check if user already has complete profile
-        if self.user_manager.has_complete_profile(chat_id):
+        with span("db.profile"):
+            complete = await self.user_manager.has_complete_profile(chat_id)
+        if complete:
             # If profile is complete, don't show the contact button
-            await self.message_sender.send_message(
-                chat_id,
-                self.config_manager.instructions["welcome"],
-                reply_markup=ReplyKeyboardRemove()
-            )
+            with span("telegram.send"):
+                await self.message_sender.send_message(
+                    chat_id,
+                    self.config_manager.instructions["welcome"],
+                    reply_markup=ReplyKeyboardRemove()
+                )
         else:
             # Show contact request button for incomplete profiles
             keyboard = [[KeyboardButton(self.config_manager.instructions["btn_text"], request_contact=True)]]
             reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-            await self.message_sender.send_message(
-                chat_id,
-                self.config_manager.instructions["welcome"],
-                reply_markup=reply_markup
-            )
+            with span("telegram.send"):
+                await self.message_sender.send_message(
+                    chat_id,
+                    self.config_manager.instructions["welcome"],
+                    reply_markup=reply_markup
+                )
+
+    def _is_admin(self, chat_id: int) -> bool:
+        admin_chat_id = self.config_manager.instructions.get("admin_chat_id")
+        return bool(admin_chat_id) and str(admin_chat_id) == str(chat_id)
+
+    @timed(HANDLER_LATENCY.labels("broadcast"), HANDLERS_IN_FLIGHT)
+    async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /broadcast <text> from the admin: send text to all users"""
+        chat_id = update.effective_chat.id
+        if self.broadcaster is None or not self._is_admin(chat_id):
+            return
+
+        parts = update.message.text.split(None, 1)
+        if len(parts) < 2:
+            await self.message_sender.send_message(chat_id, "Usage: /broadcast <message text>")
+            return
+
+        try:
+            await self.broadcaster.start(parts[1], chat_id)
+        except BroadcastError as e:
+            await self.message_sender.send_message(chat_id, f"Broadcast not started: {e}")
+
+    @timed(HANDLER_LATENCY.labels("broadcast"), HANDLERS_IN_FLIGHT)
+    async def cancel_broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /cancel_broadcast from the admin"""
+        chat_id = update.effective_chat.id
+        if self.broadcaster is None or not self._is_admin(chat_id):
+            return
+
+        if not await self.broadcaster.cancel():
+            await self.message_sender.send_message(chat_id, "No broadcast is running")
+
+    @timed(HANDLER_LATENCY.labels("admin"), HANDLERS_IN_FLIGHT)
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /profile [seconds] from the admin: sample all threads and report the hottest stacks"""
+        chat_id = update.effective_chat.id
+        if not self._is_admin(chat_id):
+            return
+
+        parts = update.message.text.split()
+        try:
+            seconds = float(parts[1]) if len(parts) > 1 else 10.0
+        except ValueError:
+            await self.message_sender.send_message(chat_id, "Usage: /profile [seconds]")
+            return
+        seconds = min(max(seconds, 1.0), self.profile_max_seconds)
+        if self.profiler.running:
+            await self.message_sender.send_message(chat_id, "A profile is already running")
+            return
+
+        await self.message_sender.send_message(chat_id, f"Profiling for {seconds:.0f}s...")
+        # The profiler samples from its own thread while the bot keeps serving updates
+        loop = asyncio.get_running_loop()
+        try:
+            report = await loop.run_in_executor(None, self.profiler.run, seconds)
+        except RuntimeError as e:
+            report = str(e)
+        await self.message_sender.send_message(chat_id, report)
+
+    @timed(HANDLER_LATENCY.labels("admin"), HANDLERS_IN_FLIGHT)
+    async def trace_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /trace [rate] from the admin: show or change the share of traces logged"""
+        chat_id = update.effective_chat.id
+        if not self._is_admin(chat_id):
+            return
 
+        parts = update.message.text.split()
+        if len(parts) > 1:
+            try:
+                rate = float(parts[1])
+            except ValueError:
+                rate = -1.0
+            if not 0 <= rate <= 1:
+                await self.message_sender.send_message(chat_id, "Usage: /trace [rate between 0 and 1]")
+                return
+            tracer.sample_rate = rate
+        await self.message_sender.send_message(
+            chat_id,
+            f"Trace sample rate {tracer.sample_rate:g}, slow threshold {tracer.slow_threshold:g}s"
+        )
+
+    @timed(HANDLER_LATENCY.labels("message"), HANDLERS_IN_FLIGHT)
+    @traced("message")
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle regular text messages and contacts"""
         chat_id = update.effective_chat.id
@@ -46,74 +162,107 @@ class MessageHandlers:
             phone = update.message.contact.phone_number
             name = update.message.contact.first_name
 
-            # Update user info
-            success = self.user_manager.update_user_info(
-                chat_id=chat_id,
-                name=name,
-                phone=phone
-            )
+            # Store the contact and fetch the details for the admin notice in one round trip
+            with span("db.register_contact"):
+                user_details = await self.user_manager.register_contact(
+                    chat_id=chat_id,
+                    name=name,
+                    phone=phone
+                )
 
-            if success:
+            if user_details:
                 # Get admin chat ID from config
                 admin_chat_id = self.config_manager.instructions.get("admin_chat_id")
 
                 if admin_chat_id:
-                    # Get user details for admin notification
-                    user_details = self.user_manager.get_user_details(chat_id)
-
-                    if user_details:
-                        # Format admin notification message
-                        admin_message = (
-                            f"🆕 New User Registration:\n"
-                            f"Name: {user_details['name']}\n"
-                            f"Phone: {user_details['phone']}\n"
-                            f"Username: @{user_details['username'] or 'Not provided'}\n"
-                            f"Registration Date: {user_details['registration_date']}"
-                        )
+                    # Format admin notification message
+                    admin_message = (
+                        f"🆕 New User Registration:\n"
+                        f"Name: {user_details['name']}\n"
+                        f"Phone: {user_details['phone']}\n"
+                        f"Username: @{user_details['username'] or 'Not provided'}\n"
+                        f"Registration Date: {user_details['registration_date']}"
+                    )
 
-                        try:
-                            # Send notification to admin
-                            await self.message_sender.send_message(
+                    try:
+                        # Send notification to admin in the background on the
+                        # low-priority lane so the user's reply isn't held up
+                        context.application.create_task(
+                            self.message_sender.send_message(
                                 int(admin_chat_id),
-                                admin_message
-                            )
-                        except Exception as e:
-                            logging.error(f"Failed to send admin notification: {e}")
+                                admin_message,
+                                priority=self.message_sender.PRIORITY_NOTIFICATION
+                            ),
+                            update=update
+                        )
+                    except Exception as e:
+                        logging.error(f"Failed to send admin notification: {e}")
 
                 thank_you_message = self.config_manager.instructions["contact_received"]
                 # Send thank you message with explicit keyboard removal
-                await self.message_sender.send_message(
-                    chat_id,
-                    thank_you_message,
-                    reply_markup=ReplyKeyboardRemove()
-                )
+                with span("telegram.send"):
+                    await self.message_sender.send_message(
+                        chat_id,
+                        thank_you_message,
+                        reply_markup=ReplyKeyboardRemove()
+                    )
             return
 
         # For text messages
         if update.message.text:
             # Check if user has shared contact information
-            if not self.user_manager.has_complete_profile(chat_id):
+            with span("db.profile"):
+                complete = await self.user_manager.has_complete_profile(chat_id)
+            if not complete:
                 # Create keyboard with contact request button
                 keyboard = [[KeyboardButton(self.config_manager.instructions["btn_text"], request_contact=True)]]
                 reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
                 access_denied_message = self.config_manager.instructions["access_denied"]
 
-                await self.message_sender.send_message(
+                with span("telegram.send"):
+                    await self.message_sender.send_message(
+                        chat_id,
+                        access_denied_message,
+                        reply_markup=reply_markup
+                    )
+                return
+
+            # The reply is traced separately, as it may merge several updates
+            with span("admission"):
+                admitted = await self.coalescer.add(chat_id, update.message.text)
+            if admitted is False:
+                slow_down_message = self.config_manager.instructions.get("slow_down") or SLOW_DOWN_MESSAGE
+                with span("telegram.send"):
+                    await self.message_sender.send_message(chat_id, slow_down_message)
+
+    async def _reply(self, chat_id: int, text: str) -> None:
+        """Answer one turn of a chat, then let older turns be summarized in the background"""
+        await tracer.run("reply", chat_id, None, self._answer(chat_id, text))
+        if self.summarizer is not None:
+            self.summarizer.schedule(chat_id)
+
+    @timed(HANDLER_LATENCY.labels("reply"))
+    async def _answer(self, chat_id: int, text: str) -> None:
+        """Answer one turn of a chat, made of one or more merged messages"""
+        if self.stream_replies:
+            # Show the reply while it is being generated
+            with span("reply.stream"):
+                await self.message_sender.stream_message(
                     chat_id,
-                    access_denied_message,
-                    reply_markup=reply_markup
+                    self.chatgpt_client.stream_response(chat_id, text),
+                    reply_markup=ReplyKeyboardRemove(),
+                    markdown=self.format_replies
                 )
-                return
+            return
 
-            # Process message with ChatGPT
-            response = await self.chatgpt_client.get_response(
-                chat_id,
-                update.message.text,
-            )
-            # Send response without any keyboard
+        # Process message with ChatGPT
+        response = await self.chatgpt_client.get_response(chat_id, text)
+        # Send response without any keyboard
+        with span("telegram.send"):
             await self.message_sender.send_message(
                 chat_id,
                 response,
-                reply_markup=ReplyKeyboardRemove()
-            )
\ No newline at end of file
+                reply_markup=ReplyKeyboardRemove(),
+                markdown=self.format_replies
+            )
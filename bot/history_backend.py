@@ -0,0 +1,398 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Set, Tuple, TypeVar
+from .database import AsyncDatabasePool
+
+T = TypeVar("T")
+
+# Buffered write operations: ("append", chat_id, role, content, created_at),
+# ("meta", chat_id, role, content, created_at) or ("clear", chat_id)
+Operation = Tuple[Any, ...]
+
+# Roles of per-chat metadata rows: at most one of each per chat, returned first by load and never compacted.
+# The running summary, and a hash of the system prompt the history was written under
+SUMMARY_ROLE = "summary"
+PROMPT_ROLE = "prompt"
+META_ROLES = (SUMMARY_ROLE, PROMPT_ROLE)
+
+
+class HistoryBackend:
+    def __init__(self, max_messages: int = 40, flush_interval: float = 1.0,
+                 batch_size: int = 200, compact_interval: float = 60.0,
+                 max_pending: int = 20000, max_attempts: int = 5):
+        """
+        Base class for persistent conversation storage
+
+        Writes are append-only and buffered in memory. They are flushed every
+        flush_interval seconds or once batch_size operations are pending, in
+        transactions of at most batch_size operations. Rows beyond the newest
+        max_messages of a chat are deleted periodically in the background.
+
+        A failed batch is retried with a growing delay. After max_attempts
+        failures its operations are written one by one and those that still
+        fail are dropped, so a bad row cannot hold up later writes. While
+        storage is down, the buffer keeps the newest max_pending operations.
+
+        Args:
+            max_messages (int): Messages per chat kept in storage and loaded on restore
+            flush_interval (float): Seconds between flushes of buffered writes
+            batch_size (int): Operations per transaction, and the number of buffered ones that triggers an early flush
+            compact_interval (float): Seconds between deletions of rows past max_messages
+            max_pending (int): Maximum number of buffered operations; the oldest are dropped beyond it
+            max_attempts (int): Failed attempts after which a batch is written one operation at a time
+        """
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: List[Operation] = []
+        # Consecutive failed attempts to write the oldest batch
+        self._failures = 0
+        self.dropped = 0
+        self._touched: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def append(self, chat_id: int, role: str, content: str) -> None:
+        """Buffer a message for persisting"""
+        self._buffer(("append", chat_id, role, content, time.time()))
+        # While writes are failing, retries wait for the flush loop's backoff
+        if len(self._pending) >= self.batch_size and not self._failures:
+            self._wakeup.set()
+
+    def set_summary(self, chat_id: int, content: str) -> None:
+        """Buffer replacing a chat's running summary"""
+        self._buffer(("meta", chat_id, SUMMARY_ROLE, content, time.time()))
+
+    def set_prompt(self, chat_id: int, prompt_hash: str) -> None:
+        """Buffer recording the system prompt a chat's history is written under"""
+        self._buffer(("meta", chat_id, PROMPT_ROLE, prompt_hash, time.time()))
+
+    def clear(self, chat_id: int) -> None:
+        """Buffer deletion of a chat's stored history"""
+        self._buffer(("clear", chat_id))
+
+    def _buffer(self, operation: Operation) -> None:
+        self._pending.append(operation)
+        if len(self._pending) > self.max_pending:
+            # Drop a whole batch at once, so a long outage logs once per batch rather than per message
+            dropped = min(self.batch_size, len(self._pending) - 1)
+            del self._pending[:dropped]
+            self.dropped += dropped
+            logging.error(
+                f"Conversation history buffer full, dropped the {dropped} oldest updates ({self.dropped} in total)"
+            )
+
+    async def load(self, chat_id: int) -> List[Tuple[str, str]]:
+        """
+        Load a chat's most recent messages, oldest first
+
+        Args:
+            chat_id (int): Telegram chat ID
+
+        Returns:
+            List[Tuple[str, str]]: (role, content) pairs, preceded by the chat's
+            metadata rows (roles in META_ROLES)
+        """
+        # Make sure buffered writes for this chat are visible
+        await self.flush()
+        return await self._run(self._load, chat_id, self.max_messages)
+
+    async def flush(self) -> None:
+        """Write all buffered operations, batch_size operations per transaction"""
+        async with self._flush_lock:
+            while self._pending:
+                operations = self._pending[:self.batch_size]
+                del self._pending[:len(operations)]
+                try:
+                    await self._run(self._write, operations)
+                except Exception as e:
+                    self._failures += 1
+                    if self._failures < self.max_attempts:
+                        logging.error(
+                            f"Error persisting {len(operations)} conversation updates "
+                            f"(attempt {self._failures}): {e}"
+                        )
+                        # Keep them for the next attempt, ahead of anything buffered since
+                        self._pending[:0] = operations
+                        return
+                    operations = await self._write_each(operations)
+                self._failures = 0
+                self._touched.update(operation[1] for operation in operations)
+
+    async def _write_each(self, operations: List[Operation]) -> List[Operation]:
+        """Write operations one at a time, dropping those that fail; returns the ones written"""
+        written = []
+        for operation in operations:
+            try:
+                await self._run(self._write, [operation])
+            except Exception as e:
+                self.dropped += 1
+                logging.error(
+                    f"Dropping conversation update of chat {operation[1]} after "
+                    f"{self.max_attempts} failed attempts ({self.dropped} dropped in total): {e}"
+                )
+            else:
+                written.append(operation)
+        return written
+
+    async def start(self) -> None:
+        """Prepare storage and start the background flush loop"""
+        await self._run(self._init_schema)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        last_compaction = time.monotonic()
+        while True:
+            # Back off while writes keep failing
+            delay = self.flush_interval * 2 ** min(self._failures, 6)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+            if self._touched and time.monotonic() - last_compaction >= self.compact_interval:
+                chat_ids, self._touched = list(self._touched), set()
+                try:
+                    await self._run(self._compact, chat_ids, self.max_messages)
+                except Exception as e:
+                    logging.error(f"Error compacting conversation history: {e}")
+                last_compaction = time.monotonic()
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run func(conn, *args) on a storage connection off the event loop"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _init_schema(conn) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _write(conn, operations: List[Operation]) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _load(conn, chat_id: int, limit: int) -> List[Tuple[str, str]]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _compact(conn, chat_ids: List[int], keep: int) -> None:
+        raise NotImplementedError
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    def __init__(self, path: str, **kwargs):
+        """
+        Conversation storage in a local SQLite database (WAL mode)
+
+        Args:
+            path (str): Database file path
+            **kwargs: Options for HistoryBackend
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        # A single thread owns the connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def _call(self, func: Callable[..., T], args: tuple) -> T:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return func(self._conn, *args)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._conn is not None:
+            await self._run(lambda conn: conn.close())
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _init_schema(conn) -> None:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_conversation_messages_chat
+            ON conversation_messages (chat_id, id)
+        """)
+        conn.commit()
+
+    @staticmethod
+    def _write(conn, operations: List[Operation]) -> None:
+        with conn:
+            for operation in operations:
+                if operation[0] == "append":
+                    conn.execute(
+                        "INSERT INTO conversation_messages (chat_id, role, content, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        operation[1:]
+                    )
+                elif operation[0] == "meta":
+                    conn.execute(
+                        "DELETE FROM conversation_messages WHERE chat_id = ? AND role = ?",
+                        operation[1:3]
+                    )
+                    conn.execute(
+                        "INSERT INTO conversation_messages (chat_id, role, content, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        operation[1:]
+                    )
+                else:
+                    conn.execute("DELETE FROM conversation_messages WHERE chat_id = ?", (operation[1],))
+
+    @staticmethod
+    def _load(conn, chat_id: int, limit: int) -> List[Tuple[str, str]]:
+        meta = conn.execute(
+            "SELECT role, content FROM conversation_messages WHERE chat_id = ? AND role IN (?, ?)",
+            (chat_id, *META_ROLES)
+        ).fetchall()
+        rows = conn.execute("""
+            SELECT role, content FROM conversation_messages
+            WHERE chat_id = ? AND role NOT IN (?, ?)
+            ORDER BY id DESC
+            LIMIT ?
+        """, (chat_id, *META_ROLES, limit)).fetchall()
+        return meta + rows[::-1]
+
+    @staticmethod
+    def _compact(conn, chat_ids: List[int], keep: int) -> None:
+        with conn:
+            for chat_id in chat_ids:
+                conn.execute("""
+                    DELETE FROM conversation_messages
+                    WHERE chat_id = ? AND role NOT IN (?, ?) AND id <= (
+                        SELECT id FROM conversation_messages
+                        WHERE chat_id = ? AND role NOT IN (?, ?)
+                        ORDER BY id DESC
+                        LIMIT 1 OFFSET ?
+                    )
+                """, (chat_id, *META_ROLES, chat_id, *META_ROLES, keep))
+
+
+class MySQLHistoryBackend(HistoryBackend):
+    # Columns the bot relies on, checked at startup
+    SCHEMA = {"conversation_messages": ("id", "chat_id", "role", "content", "created_at")}
+
+    def __init__(self, db: AsyncDatabasePool, **kwargs):
+        """
+        Conversation storage in the bot's MySQL database, shared by all instances
+
+        Args:
+            db (AsyncDatabasePool): Database access layer
+            **kwargs: Options for HistoryBackend
+        """
+        super().__init__(**kwargs)
+        self.db = db
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        return await self.db.run(func, *args)
+
+    @staticmethod
+    def _init_schema(conn) -> None:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                role VARCHAR(16) NOT NULL,
+                content MEDIUMTEXT NOT NULL,
+                created_at DOUBLE NOT NULL,
+                INDEX idx_conversation_messages_chat (chat_id, id)
+            )
+        """)
+        conn.commit()
+
+    @staticmethod
+    def _write(conn, operations: List[Operation]) -> None:
+        cursor = conn.cursor()
+        # Consecutive appends become one multi-row INSERT (flush passes at most batch_size
+        # operations); other operations keep their position
+        rows: List[Operation] = []
+        for operation in operations + [("end",)]:
+            if operation[0] == "append":
+                rows.append(operation[1:])
+                continue
+            if rows:
+                placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
+                cursor.execute(
+                    "INSERT INTO conversation_messages (chat_id, role, content, created_at) "
+                    f"VALUES {placeholders}",
+                    [value for row in rows for value in row]
+                )
+                rows = []
+            if operation[0] == "meta":
+                cursor.execute(
+                    "DELETE FROM conversation_messages WHERE chat_id = %s AND role = %s",
+                    operation[1:3]
+                )
+                cursor.execute(
+                    "INSERT INTO conversation_messages (chat_id, role, content, created_at) "
+                    "VALUES (%s, %s, %s, %s)",
+                    operation[1:]
+                )
+            elif operation[0] == "clear":
+                cursor.execute("DELETE FROM conversation_messages WHERE chat_id = %s", (operation[1],))
+        conn.commit()
+
+    @staticmethod
+    def _load(conn, chat_id: int, limit: int) -> List[Tuple[str, str]]:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT role, content FROM conversation_messages WHERE chat_id = %s AND role IN (%s, %s)",
+            (chat_id, *META_ROLES)
+        )
+        meta = cursor.fetchall()
+        cursor.execute("""
+            SELECT role, content FROM conversation_messages
+            WHERE chat_id = %s AND role NOT IN (%s, %s)
+            ORDER BY id DESC
+            LIMIT %s
+        """, (chat_id, *META_ROLES, limit))
+        return meta + cursor.fetchall()[::-1]
+
+    @staticmethod
+    def _compact(conn, chat_ids: List[int], keep: int) -> None:
+        cursor = conn.cursor()
+        for chat_id in chat_ids:
+            cursor.execute("""
+                SELECT id FROM conversation_messages
+                WHERE chat_id = %s AND role NOT IN (%s, %s)
+                ORDER BY id DESC
+                LIMIT 1 OFFSET %s
+            """, (chat_id, *META_ROLES, keep))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(
+                    "DELETE FROM conversation_messages WHERE chat_id = %s AND role NOT IN (%s, %s) AND id <= %s",
+                    (chat_id, *META_ROLES, row[0])
+                )
+        conn.commit()
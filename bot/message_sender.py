@@ -1,40 +1,427 @@
-from typing import Set, Optional
+from typing import Set, Optional, AsyncIterator, Awaitable, Callable, Dict, List, Any, TypeVar
+import asyncio
+import itertools
 import logging
-from telegram import Bot, ReplyKeyboardMarkup
-from telegram.error import TelegramError
+import random
+import time
+from telegram import Bot, Message, ReplyKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import TelegramError, RetryAfter, NetworkError, BadRequest, Forbidden
+from .formatting import MAX_MESSAGE_LENGTH, markdown_to_html, split_head, split_message, text_length
+from .rate_limit import TokenBucket, KeyedTokenBuckets
+from .metrics import TELEGRAM_SEND_LATENCY, TELEGRAM_THROTTLED, ERRORS
+
+T = TypeVar("T")
+
+
+class _ChatLock:
+    """Per-chat lock plus the number of queued sends holding or waiting on it"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
 
 
 class MessageSender:
-    def __init__(self, bot: Bot):
+    # Lower values are sent first
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_NOTIFICATION = 1
+    PRIORITY_BULK = 2
+
+    def __init__(
+            self,
+            bot: Bot,
+            edit_interval: float = 1.0,
+            global_rate: float = 30,
+            chat_rate: float = 1,
+            chat_burst: float = 3,
+            workers: int = 32,
+            max_retries: int = 3,
+            retry_backoff: float = 0.5,
+            on_forbidden: Optional[Callable[[int], Awaitable[Any]]] = None
+    ):
+        """
+        Initialize message sender
+
+        All outgoing calls go through a priority queue served by a fixed set of
+        workers. Each call waits for a global and a per-chat token bucket, so
+        bursts stay within Telegram's limits, and calls to the same chat are
+        delivered in the order they were queued.
+
+        Args:
+            bot (Bot): Telegram bot instance
+            edit_interval (float): Minimum seconds between edits of a streamed message
+            global_rate (float): Maximum messages per second across all chats
+            chat_rate (float): Maximum messages per second to a single chat
+            chat_burst (float): Number of messages a chat may receive in a quick burst
+            workers (int): Number of concurrent send workers
+            max_retries (int): Retries of a call failing with a transient network error
+            retry_backoff (float): Base delay in seconds for exponential retry backoff
+            on_forbidden (Optional[Callable[[int], Awaitable]]): Called with the chat ID when a user blocked the bot
+        """
         self.bot = bot
         self.active_chats: Set[int] = set()
+        self.edit_interval = edit_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.worker_count = workers
+        self.on_forbidden = on_forbidden
+        self._callbacks: Set[asyncio.Task] = set()
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = KeyedTokenBuckets(chat_rate, chat_burst)
+        self._chat_locks: Dict[int, _ChatLock] = {}
+        self._paused_until = 0.0
+        self._sequence = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
 
     async def send_message(
             self,
             chat_id: int,
             text: str,
-            reply_markup: Optional[ReplyKeyboardMarkup] = None
+            reply_markup: Optional[ReplyKeyboardMarkup] = None,
+            priority: int = PRIORITY_INTERACTIVE,
+            markdown: bool = False
     ) -> bool:
         """
         Send a message to a specific chat
 
+        Text over Telegram's length limit is split at paragraph or sentence
+        boundaries. All chunks are queued at once and delivered in order, with
+        the keyboard attached to the last one.
+
         Args:
             chat_id (int): The ID of the chat to send the message to
             text (str): The text message to send
             reply_markup (Optional[ReplyKeyboardMarkup]): Optional keyboard markup for the message
+            priority (int): Queue priority, PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION or PRIORITY_BULK
+            markdown (bool): Render the text as Markdown, falling back to plain text
 
         Returns:
             bool: True if message was sent successfully, False otherwise
         """
+        chunks = split_message(text, MAX_MESSAGE_LENGTH, markdown) or [text]
+        results = await asyncio.gather(
+            *(
+                self.submit(
+                    chat_id,
+                    self._text_call(
+                        chat_id,
+                        chunk,
+                        reply_markup=reply_markup if i == len(chunks) - 1 else None,
+                        markdown=markdown
+                    ),
+                    priority
+                )
+                for i, chunk in enumerate(chunks)
+            ),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, TelegramError):
+                self._handle_error(chat_id, result)
+                return False
+            if isinstance(result, BaseException):
+                raise result
+        return True
+
+    async def stream_message(
+            self,
+            chat_id: int,
+            chunks: AsyncIterator[str],
+            reply_markup: Optional[ReplyKeyboardMarkup] = None,
+            markdown: bool = False
+    ) -> bool:
+        """
+        Send a message that is progressively filled in as text chunks arrive
+
+        The message is sent as soon as the first chunk arrives and is then edited
+        in place. Chunks arriving between edits are coalesced, so edits happen at
+        most once per edit_interval, followed by a final edit with the full text.
+        When the text outgrows one message, the message is completed at a
+        paragraph or sentence boundary and the rest continues in a new one.
+
+        Args:
+            chat_id (int): The ID of the chat to send the message to
+            chunks (AsyncIterator[str]): Successive pieces of the message text
+            reply_markup (Optional[ReplyKeyboardMarkup]): Optional keyboard markup for the first message
+            markdown (bool): Render the completed messages as Markdown, falling back to plain text
+
+        Returns:
+            bool: True if the complete message was delivered, False otherwise
+        """
+        text = ""
+        shown = ""
+        message = None
+        delivered = False
+        last_edit = 0.0
         try:
-            await self.bot.send_message(
+            async for chunk in chunks:
+                text += chunk
+                while text_length(text) > MAX_MESSAGE_LENGTH:
+                    head, rest = split_head(text, MAX_MESSAGE_LENGTH, markdown)
+                    await self._finish_streamed(chat_id, message, head, shown, reply_markup, markdown)
+                    delivered = True
+                    reply_markup = None
+                    message, text, shown = None, rest, ""
+                if not text.strip():
+                    continue
+                if message is None:
+                    first = text
+                    message = await self.submit(
+                        chat_id,
+                        lambda: self.bot.send_message(
+                            chat_id=chat_id,
+                            text=first,
+                            reply_markup=reply_markup
+                        )
+                    )
+                    reply_markup = None
+                    shown = first
+                    last_edit = time.monotonic()
+                # Telegram trims surrounding whitespace, so a whitespace-only change is no edit
+                elif time.monotonic() - last_edit >= self.edit_interval and text.rstrip() != shown.rstrip():
+                    shown = text
+                    await self.submit(chat_id, lambda: message.edit_text(shown))
+                    last_edit = time.monotonic()
+
+            if text.strip():
+                await self._finish_streamed(chat_id, message, text, shown, reply_markup, markdown)
+                delivered = True
+            return delivered
+        except TelegramError as e:
+            self._handle_error(chat_id, e)
+            # Stop generating a reply that can no longer be shown
+            aclose = getattr(chunks, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            return False
+
+    async def _finish_streamed(
+            self,
+            chat_id: int,
+            message: Optional[Message],
+            text: str,
+            shown: str,
+            reply_markup: Optional[ReplyKeyboardMarkup],
+            markdown: bool
+    ) -> None:
+        """Complete a streamed message with its final text, sending it if it was never shown"""
+        if message is None:
+            await self.submit(chat_id, self._text_call(chat_id, text, reply_markup=reply_markup, markdown=markdown))
+        elif text.rstrip() != shown.rstrip() or (markdown and markdown_to_html(text) is not None):
+            await self.submit(chat_id, self._text_call(chat_id, text, message=message, markdown=markdown))
+
+    def _text_call(
+            self,
+            chat_id: int,
+            text: str,
+            message: Optional[Message] = None,
+            reply_markup: Optional[ReplyKeyboardMarkup] = None,
+            markdown: bool = False
+    ) -> Callable[[], Awaitable[Message]]:
+        """
+        Build a call sending text, or replacing the text of message
+
+        With markdown, the text is sent as HTML and, if Telegram cannot parse
+        it, sent again as plain text within the same queued call.
+        """
+        async def call() -> Message:
+            formatted = markdown_to_html(text) if markdown else None
+            if formatted is not None:
+                try:
+                    return await self._send_text(chat_id, formatted, message, reply_markup, ParseMode.HTML)
+                except BadRequest as e:
+                    if "parse" not in str(e).lower():
+                        raise
+                    logging.warning(f"Sending reply to {chat_id} as plain text: {e}")
+            return await self._send_text(chat_id, text, message, reply_markup, None)
+        return call
+
+    async def _send_text(
+            self,
+            chat_id: int,
+            text: str,
+            message: Optional[Message],
+            reply_markup: Optional[ReplyKeyboardMarkup],
+            parse_mode: Optional[str]
+    ) -> Message:
+        if message is None:
+            return await self.bot.send_message(
                 chat_id=chat_id,
                 text=text,
-                reply_markup=reply_markup
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
             )
-            return True
-        except TelegramError as e:
-            logging.error(f"Failed to send message to {chat_id}: {e}")
-            if "Forbidden" in str(e):
-                self.active_chats.discard(chat_id)
-            return False
+        try:
+            result = await message.edit_text(text, parse_mode=parse_mode)
+        except BadRequest as e:
+            if not self._is_not_modified(e):
+                raise
+            return message
+        # edit_text returns True instead of a Message for inline messages
+        return result if isinstance(result, Message) else message
+
+    @staticmethod
+    def _is_not_modified(error: BadRequest) -> bool:
+        """Whether an edit was rejected only because the text is already shown"""
+        return "message is not modified" in str(error).lower()
+
+    def _handle_error(self, chat_id: int, error: TelegramError) -> None:
+        logging.error(f"Failed to send message to {chat_id}: {error}")
+        if isinstance(error, Forbidden) or "Forbidden" in str(error):
+            self.active_chats.discard(chat_id)
+            if self.on_forbidden is not None:
+                task = asyncio.create_task(self.on_forbidden(chat_id))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+
+    async def submit(
+            self,
+            chat_id: int,
+            call: Callable[[], Awaitable[T]],
+            priority: int = PRIORITY_INTERACTIVE
+    ) -> T:
+        """
+        Queue a Telegram API call for a chat and wait for its result
+
+        Args:
+            chat_id (int): Chat the call targets, used for per-chat rate limiting and ordering
+            call (Callable[[], Awaitable[T]]): Function performing the API call
+            priority (int): Queue priority; lower values are sent first
+
+        Returns:
+            T: Result of the call
+
+        Raises:
+            TelegramError: If the call failed after retries
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._sequence), chat_id, call, future, time.monotonic()))
+        return await future
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.worker_count)
+            ]
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, chat_id, call, future, queued_at = await self._queue.get()
+            try:
+                if future.done():
+                    continue
+                slot = self._chat_locks.get(chat_id)
+                if slot is None:
+                    slot = self._chat_locks[chat_id] = _ChatLock()
+                slot.users += 1
+                try:
+                    async with slot.lock:
+                        result = await self._deliver(chat_id, call)
+                finally:
+                    slot.users -= 1
+                    if not slot.users:
+                        self._chat_locks.pop(chat_id, None)
+                if not future.done():
+                    future.set_result(result)
+                self._record(queued_at, success=True)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                self._record(queued_at, success=False)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Perform a call within rate limits, honoring flood control and retrying transient errors"""
+        attempt = 0
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._global_bucket.acquire()
+            await self._chat_buckets.get(chat_id).acquire()
+            try:
+                result = await call()
+                self.active_chats.add(chat_id)
+                return result
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so every worker pauses
+                self.throttled += 1
+                TELEGRAM_THROTTLED.inc()
+                logging.warning(f"Telegram flood control, retrying in {e.retry_after}s")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except BadRequest as e:
+                # The edit is already shown, which is what the caller wanted
+                if self._is_not_modified(e):
+                    return None
+                raise
+            except NetworkError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning(f"Transient error sending to {chat_id}: {e}, retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _record(self, queued_at: float, success: bool) -> None:
+        latency = time.monotonic() - queued_at
+        TELEGRAM_SEND_LATENCY.observe(latency)
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+            ERRORS.labels("telegram").inc()
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def queue_length(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get outbound queue statistics
+
+        Returns:
+            Dict[str, Any]: Queue length, delivery counters and send latency (queue wait included)
+        """
+        completed = self.sent + self.failed
+        return {
+            "queue_length": self.queue_length,
+            "sent": self.sent,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "avg_latency": self.total_latency / completed if completed else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Wait up to timeout seconds for queued messages to be delivered, then stop the workers"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Dropping {self._queue.qsize()} unsent messages on shutdown")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
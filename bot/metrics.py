@@ -0,0 +1,138 @@
+import functools
+import time
+from typing import Any, Callable, Iterator, Optional
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+# Histogram buckets in seconds, from fast DB lookups to slow completions
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Time spent handling an update", ["handler"], buckets=LATENCY_BUCKETS
+)
+OPENAI_LATENCY = Histogram(
+    "bot_openai_request_seconds", "Duration of OpenAI completion requests", ["mode"], buckets=LATENCY_BUCKETS
+)
+OPENAI_FIRST_TOKEN = Histogram(
+    "bot_openai_first_token_seconds", "Time to first token of streamed completions", buckets=LATENCY_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    "bot_db_query_seconds", "Duration of database operations, connection wait included", ["method"],
+    buckets=LATENCY_BUCKETS
+)
+TELEGRAM_SEND_LATENCY = Histogram(
+    "bot_telegram_send_seconds", "Time from queueing a Telegram API call to its completion",
+    buckets=LATENCY_BUCKETS
+)
+
+ERRORS = Counter("bot_errors_total", "Errors by component", ["component"])
+TELEGRAM_THROTTLED = Counter("bot_telegram_throttled_total", "Telegram 429 flood-control responses")
+OPENAI_RETRIES = Counter("bot_openai_retries_total", "OpenAI requests retried after a transient error")
+OPENAI_HEDGES = Counter("bot_openai_hedges_total", "Duplicate OpenAI requests sent for slow requests")
+
+OPENAI_IN_FLIGHT = Gauge("bot_openai_in_flight", "OpenAI requests in flight")
+HANDLERS_IN_FLIGHT = Gauge("bot_handlers_in_flight", "Updates being handled")
+
+
+def timed(histogram: Histogram, in_flight: Optional[Gauge] = None) -> Callable:
+    """Decorator recording the duration of a coroutine function in a histogram (child)"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if in_flight is not None:
+                in_flight.inc()
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+                if in_flight is not None:
+                    in_flight.dec()
+        return wrapper
+    return decorator
+
+
+class BotCollector(Collector):
+    def __init__(self, bot):
+        """
+        Read component statistics at scrape time, so the hot path pays nothing for them
+
+        Args:
+            bot (TelegramBot): Bot whose components are reported
+        """
+        self.bot = bot
+
+    def collect(self) -> Iterator:
+        yield GaugeMetricFamily("bot_ready", "Whether startup warm-up has finished", value=int(self.bot.ready))
+
+        caches = CounterMetricFamily("bot_cache_lookups", "Cache lookups", labels=["cache", "result"])
+        sizes = GaugeMetricFamily("bot_cache_entries", "Cache entries", labels=["cache"])
+        for name, cache in self._caches():
+            stats = cache.stats()
+            caches.add_metric([name, "hit"], stats["hits"])
+            caches.add_metric([name, "miss"], stats["misses"])
+            sizes.add_metric([name], stats["size"])
+        yield caches
+        yield sizes
+
+        conversations = self.bot.chatgpt_client.conversations
+        yield GaugeMetricFamily("bot_conversations", "Conversations held in memory", value=len(conversations))
+        yield GaugeMetricFamily(
+            "bot_conversation_chars", "Total characters of conversations in memory", value=conversations.total_chars
+        )
+        yield CounterMetricFamily(
+            "bot_conversation_evictions", "Conversations evicted from memory", value=conversations.evictions
+        )
+
+        breaker = self.bot.chatgpt_client.resilience.breaker
+        yield GaugeMetricFamily("bot_openai_circuit_open", "Whether the OpenAI circuit breaker is open",
+                                value=int(breaker.is_open))
+
+        if self.bot.summarizer is not None:
+            summarizer = self.bot.summarizer.stats()
+            yield CounterMetricFamily("bot_summaries", "Conversation summaries written", value=summarizer["summaries"])
+            yield CounterMetricFamily(
+                "bot_summary_failures", "Conversation summaries that failed", value=summarizer["failures"]
+            )
+            yield GaugeMetricFamily("bot_summary_queue", "Chats waiting for a summary", value=summarizer["queued"])
+
+        updates = self.bot.update_processor.stats()
+        yield GaugeMetricFamily("bot_update_queue_depth", "Updates waiting to be handled", value=updates["queue_depth"])
+        yield GaugeMetricFamily("bot_update_max_wait_seconds", "Longest update queue wait", value=updates["max_wait"])
+        yield GaugeMetricFamily(
+            "bot_update_backlog", "Updates admitted (waiting or being handled)", value=updates["admitted"]
+        )
+
+        admission = self.bot.handlers.coalescer.stats()
+        yield CounterMetricFamily(
+            "bot_messages_rejected", "Messages rejected by per-chat rate limiting", value=admission["rejected"]
+        )
+        yield CounterMetricFamily("bot_turns", "ChatGPT turns produced from merged messages", value=admission["turns"])
+        yield GaugeMetricFamily("bot_pending_chats", "Chats with messages awaiting a reply", value=admission["pending_chats"])
+        yield GaugeMetricFamily("bot_turns_in_progress", "ChatGPT turns being answered", value=admission["running"])
+        yield GaugeMetricFamily(
+            "bot_turns_waiting", "Messages waiting for room to start a turn", value=admission["waiting"]
+        )
+
+        sender = self.bot.message_sender.stats()
+        yield GaugeMetricFamily("bot_send_queue_length", "Telegram calls waiting to be sent", value=sender["queue_length"])
+        yield CounterMetricFamily("bot_send_failures", "Telegram calls that failed", value=sender["failed"])
+
+    def _caches(self) -> Iterator:
+        yield "profile", self.bot.user_manager.profile_cache
+        if self.bot.chatgpt_client.response_cache is not None:
+            yield "response", self.bot.chatgpt_client.response_cache
+
+
+def start_metrics_server(bot, port: int, addr: str = "127.0.0.1") -> None:
+    """
+    Serve metrics in Prometheus text format from a background thread
+
+    Args:
+        bot (TelegramBot): Bot whose component statistics are exported
+        port (int): HTTP port
+        addr (str): Address to bind
+    """
+    REGISTRY.register(BotCollector(bot))
+    start_http_server(port, addr=addr)
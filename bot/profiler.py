@@ -0,0 +1,136 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Tuple
+
+# Prefix of installed and standard library paths, up to the package-relative part
+_LIBRARY_PREFIX = re.compile(r"^.*[/\\](?:site-packages|python\d+(?:\.\d+)?)[/\\]")
+
+# Innermost frames of a thread waiting for work: (file name, function)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    # Executor threads block in C (SimpleQueue.get) directly below this frame
+    ("thread.py", "_worker"),
+}
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, depth: int = 8, top: int = 5):
+        """
+        Statistical profiler sampling the stacks of all threads
+
+        A background thread reads sys._current_frames() every interval
+        seconds, so the profiled code is not instrumented and runs at full
+        speed. Samples of threads waiting for work (an idle event loop, idle
+        executor or server threads) are skipped, so the report shows where
+        time goes: the event loop thread shows what blocks the loop, the
+        database and history threads where MySQL and SQLite work goes.
+
+        Args:
+            interval (float): Seconds between samples
+            depth (int): Innermost frames kept per stack
+            top (int): Number of stacks and functions reported
+        """
+        self.interval = interval
+        self.depth = depth
+        self.top = top
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, seconds: float) -> str:
+        """
+        Sample for the given time and report the hottest stacks; blocks the calling thread
+
+        Args:
+            seconds (float): Profiling duration
+
+        Returns:
+            str: Plain-text report
+
+        Raises:
+            RuntimeError: If a profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            stacks, samples, idle, elapsed = self._sample(seconds)
+        finally:
+            self._lock.release()
+        return self._report(stacks, samples, idle, elapsed)
+
+    def _sample(self, seconds: float) -> Tuple[Counter, int, int, float]:
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        idle = 0
+        started = time.monotonic()
+        deadline = started + seconds
+        while time.monotonic() < deadline:
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self._is_idle(frame):
+                    idle += 1
+                    continue
+                stacks[(names.get(thread_id, str(thread_id)), self._stack(frame))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples, idle, time.monotonic() - started
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        code = frame.f_code
+        return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        frames = []
+        while frame is not None and len(frames) < self.depth:
+            code = frame.f_code
+            frames.append(f"{self._short_path(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+            frame = frame.f_back
+        return tuple(reversed(frames))
+
+    @staticmethod
+    def _short_path(path: str) -> str:
+        short = _LIBRARY_PREFIX.sub("", path)
+        if short != path:
+            return short
+        return os.path.relpath(path) if path.startswith(os.getcwd()) else path
+
+    def _report(self, stacks: Counter, samples: int, idle: int, elapsed: float) -> str:
+        if not samples:
+            return "No samples taken"
+        lines = [
+            f"Profile: {samples} samples in {elapsed:.1f}s, {idle} idle thread samples skipped "
+            f"(% of samples a thread was in a stack)"
+        ]
+        if not stacks:
+            lines.append("All threads were idle")
+
+        for (thread, stack), count in stacks.most_common(self.top):
+            lines.append("")
+            lines.append(f"{100 * count / samples:.1f}% {thread}")
+            lines.extend(f"  {frame}" for frame in stack)
+
+        # Innermost frame per thread, summed over stacks
+        functions: Counter = Counter()
+        for (thread, stack), count in stacks.items():
+            if stack:
+                functions[(thread, stack[-1])] += count
+        lines.append("")
+        lines.append("Hottest functions:")
+        lines.extend(
+            f"{100 * count / samples:.1f}% {thread} {frame}"
+            for (thread, frame), count in functions.most_common(self.top * 2)
+        )
+        return "\n".join(lines)
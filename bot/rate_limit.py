@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Token bucket rate limiter
+
+        Args:
+            rate (float): Tokens added per second
+            capacity (float): Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Take tokens if they are available right now
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Take tokens unconditionally, going into debt if needed
+
+        Returns:
+            float: Seconds to wait before the reserved tokens may be used
+        """
+        self._refill()
+        self.tokens -= tokens
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until tokens are available and take them; waiters are served in order"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class KeyedTokenBuckets:
+    def __init__(self, rate: float, capacity: float, max_idle_buckets: int = 10000):
+        """
+        One token bucket per key (e.g. per chat)
+
+        Args:
+            rate (float): Tokens added per second to each bucket
+            capacity (float): Burst size of each bucket
+            max_idle_buckets (int): Number of buckets above which full (idle) ones are dropped
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_idle_buckets = max_idle_buckets
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_idle_buckets:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket
+
+    def _prune(self) -> None:
+        # A full bucket behaves exactly like a new one, so it can be dropped safely
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full]:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
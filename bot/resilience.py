@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from .metrics import OPENAI_RETRIES, OPENAI_HEDGES
+
+T = TypeVar("T")
+
+# Errors worth another attempt: timeouts, connection failures, 429 and 5xx responses
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 200):
+        """
+        Ring buffer of recent request durations
+
+        Args:
+            size (int): Number of most recent durations kept
+        """
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Duration below which percent of recent requests finished, None without samples"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Stop calling a failing service and probe it again after a while
+
+        After failure_threshold consecutive failures the circuit opens and
+        calls are refused. Once reset_timeout has passed, a single trial call
+        is let through: success closes the circuit, failure opens it again.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """Let another trial call through after one ended without an outcome"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logging.info("OpenAI circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.warning(f"OpenAI circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != self.CLOSED
+
+
+class ResilientCaller:
+    def __init__(
+            self,
+            model: str,
+            fallback_model: Optional[str] = None,
+            max_retries: int = 2,
+            backoff: float = 0.5,
+            max_backoff: float = 8.0,
+            deadline: float = 60.0,
+            hedge: bool = False,
+            hedge_min_delay: float = 2.0,
+            hedge_percentile: float = 95,
+            hedge_budget: float = 0.1,
+            hedge_min_samples: int = 20,
+            breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Retries, hedging and a circuit breaker around completion calls
+
+        Retryable errors are retried with full-jitter exponential backoff
+        within an overall deadline. With hedging, a duplicate request is sent
+        when the first has not finished by the recent p95 latency, and the
+        first result wins; hedges are limited to a fraction of requests so a
+        general slowdown doesn't double the load. While the circuit is open,
+        calls go to the fallback model or fail immediately.
+
+        Args:
+            model (str): Primary model
+            fallback_model (Optional[str]): Model used while the primary's circuit is open
+            max_retries (int): Retries after the first attempt
+            backoff (float): Base backoff in seconds
+            max_backoff (float): Upper bound of a single backoff
+            deadline (float): Seconds after which no further attempt is started
+            hedge (bool): Whether to send hedged requests
+            hedge_min_delay (float): Minimum seconds before a hedge is sent
+            hedge_percentile (float): Latency percentile after which a hedge is sent
+            hedge_budget (float): Maximum share of requests that may be hedged
+            hedge_min_samples (int): Latency samples needed before hedging starts
+            breaker (Optional[CircuitBreaker]): Circuit breaker of the primary model
+        """
+        self.model = model
+        self.fallback_model = fallback_model
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.hedges = 0
+
+    async def call(self, request: Callable[[str], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        Run request(model) resiliently
+
+        Args:
+            request (Callable[[str], Awaitable[T]]): Performs one attempt with the given model
+            hedge (bool): Whether this call may be hedged (not for streams)
+
+        Returns:
+            T: Result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: If the circuit is open and there is no fallback model
+            Exception: The last error once retries or the deadline are exhausted
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            model = self._pick_model()
+            primary = model == self.model
+            try:
+                result = await self._attempt(request, model, hedge and primary)
+            except RETRYABLE_ERRORS as e:
+                if primary:
+                    self.breaker.record_failure()
+                delay = self._backoff(attempt, e)
+                if attempt >= self.max_retries or time.monotonic() - started + delay >= self.deadline:
+                    raise
+                attempt += 1
+                OPENAI_RETRIES.inc()
+                logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                # No outcome, but a cancelled trial call must not keep the circuit half-open
+                if primary:
+                    self.breaker.release_trial()
+                raise
+            except Exception:
+                # The service answered (e.g. 400 or 401): it is up, the request was at fault
+                if primary:
+                    self.breaker.record_success()
+                raise
+            if primary:
+                self.breaker.record_success()
+            return result
+
+    def _pick_model(self) -> str:
+        if self.breaker.allow():
+            return self.model
+        if self.fallback_model:
+            return self.fallback_model
+        raise CircuitOpenError("OpenAI circuit is open")
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if isinstance(error, RateLimitError):
+            retry_after = error.response.headers.get("retry-after")
+            try:
+                delay = max(delay, min(self.max_backoff, float(retry_after)))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    async def _attempt(self, request: Callable[[str], Awaitable[T]], model: str, hedge: bool) -> T:
+        self.requests += 1
+        started = time.monotonic()
+        delay = self._hedge_delay() if hedge else None
+        if delay is None:
+            result = await request(model)
+        else:
+            result = await self._hedged(request, model, delay)
+        if hedge:
+            self.latency.observe(time.monotonic() - started)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        if self.hedges >= self.hedge_budget * self.requests:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(self.hedge_percentile))
+
+    async def _hedged(self, request: Callable[[str], Awaitable[T]], model: str, delay: float) -> T:
+        first = asyncio.ensure_future(request(model))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        OPENAI_HEDGES.inc()
+        pending = {first, asyncio.ensure_future(request(model))}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    # Both failed: surface the error of the original request
+                    return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
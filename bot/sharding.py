@@ -0,0 +1,336 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import signal
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Bot, Update
+from telegram.ext import Updater
+from config import (
+    LOG_LEVEL,
+    METRICS_PORT,
+    TELEGRAM_MODE,
+    TELEGRAM_BASE_URL,
+    UPDATE_QUEUE_SIZE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+)
+
+# Inbox item key telling a worker the current ring nodes, so it drops chats it no longer owns
+_RING = "ring"
+
+
+class HashRing:
+    def __init__(self, nodes: List[int] = (), replicas: int = 100):
+        """
+        Consistent hash ring mapping keys (chat IDs) to nodes (workers)
+
+        Every node is placed on the ring at many virtual points, so keys are
+        spread evenly and removing a node only moves the keys it owned.
+
+        Args:
+            nodes (List[int]): Initial nodes
+            replicas (int): Virtual points per node
+        """
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def add(self, node: int) -> None:
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}:{replica}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: int) -> None:
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}:{replica}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.pop(bisect.bisect_left(self._points, point))
+
+    def get(self, key: int) -> Optional[int]:
+        """Node owning key, or None if the ring is empty"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
+
+    @property
+    def nodes(self) -> List[int]:
+        return sorted(set(self._owners.values()))
+
+
+def _worker_main(worker_id: int, worker_count: int, inbox: "multiprocessing.Queue", ready: "multiprocessing.Queue",
+                 telegram_token: str, openai_api_key: str, config_file: str) -> None:
+    """Entry point of a worker process: run a full bot fed with updates from inbox"""
+    from .core import TelegramBot
+    from .utils import setup_logging
+
+    # The supervisor handles interrupts and tells workers to stop via inbox
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(LOG_LEVEL)
+    metrics_port = METRICS_PORT + 1 + worker_id if METRICS_PORT else 0
+    # Workers share the bot's global Telegram rate limit
+    bot = TelegramBot(telegram_token, openai_api_key, config_file, metrics_port=metrics_port,
+                      send_rate_share=1 / worker_count)
+    asyncio.run(_serve_worker(worker_id, bot, inbox, ready))
+
+
+async def _serve_worker(worker_id: int, bot, inbox: "multiprocessing.Queue", ready: "multiprocessing.Queue") -> None:
+    await bot.start()
+    ready.put(worker_id)
+    logging.info(f"Worker {worker_id} ready")
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, inbox.get)
+            if item is None:
+                break
+            key, data = item
+            if key == _RING:
+                ring = HashRing(data)
+                released = await bot.release_chats(lambda chat_id: ring.get(chat_id) == worker_id)
+                logging.info(f"Worker {worker_id} released {released} conversations of chats that moved")
+                continue
+            # Waits while the bot's backlog and update queue are full, pausing reads from inbox
+            await bot.app.update_queue.put(Update.de_json(data, bot.app.bot))
+    finally:
+        await bot.stop()
+        logging.info(f"Worker {worker_id} stopped")
+
+
+class _Worker:
+    __slots__ = ("worker_id", "inbox", "process", "restarts", "restart_at")
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.inbox: Optional[multiprocessing.Queue] = None
+        self.process: Optional[multiprocessing.Process] = None
+        self.restarts = 0
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    def __init__(
+            self,
+            worker_count: int,
+            telegram_token: str,
+            openai_api_key: str,
+            config_file: str,
+            check_interval: float = 1.0,
+            stop_timeout: float = 30.0,
+            max_restart_delay: float = 60.0
+    ):
+        """
+        Run the bot as several worker processes sharded by chat
+
+        The supervisor receives updates (polling or webhook, as configured) and
+        routes each to a worker by consistent hashing of its chat ID, so all
+        state of a chat lives in one process. When a worker dies its chats are
+        moved to the remaining workers and the updates waiting in its inbox are
+        re-routed; once a replacement is ready, its chats move back and the
+        other workers drop their in-memory state of those chats. Each
+        worker sends at an equal share of the bot's global Telegram rate.
+
+        Args:
+            worker_count (int): Number of worker processes
+            telegram_token (str): Telegram bot token
+            openai_api_key (str): OpenAI API key
+            config_file (str): Path to the Excel configuration
+            check_interval (float): Seconds between worker health checks
+            stop_timeout (float): Seconds workers get to finish queued updates on shutdown
+            max_restart_delay (float): Upper bound of the growing delay before restarting a crashing worker
+        """
+        self.worker_count = worker_count
+        self.telegram_token = telegram_token
+        self.openai_api_key = openai_api_key
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self.stop_timeout = stop_timeout
+        self.max_restart_delay = max_restart_delay
+        # Workers must not inherit the supervisor's threads and connections
+        self._context = multiprocessing.get_context("spawn")
+        self._ready = self._context.Queue()
+        self._workers = [_Worker(worker_id) for worker_id in range(worker_count)]
+        self.ring = HashRing()
+        self.routed = 0
+
+    def run(self) -> None:
+        """Run until interrupted"""
+        asyncio.run(self._run())
+
+    def _spawn(self, worker: _Worker) -> None:
+        worker.inbox = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, self.worker_count, worker.inbox, self._ready, self.telegram_token,
+                  self.openai_api_key, self.config_file),
+            name=f"bot-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.process.start()
+
+    @staticmethod
+    def _routing_key(update: Update) -> int:
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return update.update_id
+
+    def _route(self, key: int, data: Dict[str, Any]) -> None:
+        worker_id = self.ring.get(key)
+        if worker_id is None:
+            logging.error(f"No worker available, dropping update {data.get('update_id')}")
+            return
+        self._workers[worker_id].inbox.put((key, data))
+        self.routed += 1
+
+    async def _dispatch(self, updates: "asyncio.Queue[Any]") -> None:
+        while True:
+            update = await updates.get()
+            if isinstance(update, Update):
+                self._route(self._routing_key(update), update.to_dict())
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            self._add_ready_workers()
+            for worker in self._workers:
+                if worker.restart_at is not None:
+                    if loop.time() >= worker.restart_at:
+                        worker.restart_at = None
+                        self._spawn(worker)
+                    continue
+                if worker.process.is_alive():
+                    continue
+
+                logging.error(f"Worker {worker.worker_id} exited with code {worker.process.exitcode}")
+                # Rebalance: the ring hands this worker's chats to its neighbours
+                self.ring.remove(worker.worker_id)
+                pending = await loop.run_in_executor(None, self._drain, worker.inbox)
+                for key, data in pending:
+                    self._route(key, data)
+                if pending:
+                    logging.info(f"Re-routed {len(pending)} updates of worker {worker.worker_id}")
+                # Back off when a worker keeps crashing before it gets ready
+                delay = min(self.max_restart_delay, 2 ** worker.restarts - 1)
+                worker.restarts += 1
+                worker.restart_at = loop.time() + delay
+
+    def _add_ready_workers(self) -> None:
+        while True:
+            try:
+                worker_id = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            if worker_id not in self.ring.nodes:
+                self.ring.add(worker_id)
+                logging.info(f"Worker {worker_id} rejoined, now serving {len(self.ring.nodes)} workers")
+                # Chats handed back must not be served from a neighbour's stale copy if they move again.
+                # Sent through the inboxes, so it is handled after the updates routed before the change
+                nodes = self.ring.nodes
+                for node in nodes:
+                    if node != worker_id:
+                        self._workers[node].inbox.put((_RING, nodes))
+            self._workers[worker_id].restarts = 0
+
+    @staticmethod
+    def _drain(inbox: "multiprocessing.Queue") -> List[Tuple[int, Dict[str, Any]]]:
+        """Take the updates a dead worker left behind"""
+        pending = []
+        while True:
+            try:
+                # A timeout rather than get_nowait: the dead process may have held the read lock
+                item = inbox.get(timeout=0.1)
+            except (queue.Empty, OSError, ValueError):
+                return pending
+            if item is not None and item[0] != _RING:
+                pending.append(item)
+
+    async def _run(self) -> None:
+        # Initially every worker owns its chats right away; updates wait in its inbox while it starts
+        for worker in self._workers:
+            self._spawn(worker)
+            self.ring.add(worker.worker_id)
+        logging.info(f"Started {self.worker_count} workers")
+
+        updates: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE)
+        bot = Bot(self.telegram_token, base_url=TELEGRAM_BASE_URL) if TELEGRAM_BASE_URL else Bot(self.telegram_token)
+        updater = Updater(bot, updates)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        async with updater:
+            if TELEGRAM_MODE == "webhook":
+                if not WEBHOOK_URL or not WEBHOOK_SECRET:
+                    raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+                await updater.start_webhook(
+                    listen=WEBHOOK_LISTEN,
+                    port=WEBHOOK_PORT,
+                    url_path=WEBHOOK_PATH,
+                    webhook_url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET
+                )
+            else:
+                await updater.start_polling()
+            logging.info(f"Receiving updates ({TELEGRAM_MODE})")
+            tasks = [asyncio.create_task(self._dispatch(updates)), asyncio.create_task(self._monitor())]
+            try:
+                await stop.wait()
+            finally:
+                await updater.stop()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                # Route what was received before stopping
+                while not updates.empty():
+                    update = updates.get_nowait()
+                    if isinstance(update, Update):
+                        self._route(self._routing_key(update), update.to_dict())
+                await self._stop_workers()
+
+    async def _stop_workers(self) -> None:
+        running = [worker for worker in self._workers if worker.process.is_alive()]
+        for worker in running:
+            worker.inbox.put(None)
+        loop = asyncio.get_running_loop()
+        for worker in running:
+            await loop.run_in_executor(None, worker.process.join, self.stop_timeout)
+            if worker.process.is_alive():
+                logging.warning(f"Worker {worker.worker_id} did not stop in time, terminating")
+                worker.process.terminate()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get supervisor statistics
+
+        Returns:
+            Dict[str, Any]: Routed updates and per-worker liveness and restart counts
+        """
+        return {
+            "routed": self.routed,
+            "workers": {
+                worker.worker_id: {
+                    "alive": worker.process is not None and worker.process.is_alive(),
+                    "restarts": worker.restarts,
+                }
+                for worker in self._workers
+            },
+        }
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+from .conversation_store import Conversation, ConversationStore, SUMMARY_PREFIX
+from .history_backend import HistoryBackend
+from .rate_limit import TokenBucket
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a consultation between a user and an assistant. "
+    "Update the summary with the new turns. Keep every fact, name, number, preference and "
+    "open question that may matter later; drop small talk. Write in the language of the "
+    "conversation, as concise notes, without any introduction."
+)
+
+
+class ConversationSummarizer:
+    def __init__(
+            self,
+            client,
+            conversations: ConversationStore,
+            model: str,
+            history_backend: Optional[HistoryBackend] = None,
+            min_messages: int = 4,
+            rate: float = 1.0,
+            max_tokens: int = 300,
+            max_queued: int = 1000,
+            request_timeout: float = 30.0
+    ):
+        """
+        Compact turns that left a conversation's window into a running summary
+
+        After a reply has been sent, a chat with at least min_messages turns
+        outside the window is queued. A single background worker summarizes
+        queued chats one at a time at no more than rate requests per second,
+        so summaries never compete with replies for the OpenAI concurrency
+        limit and a reply never waits for one. Chats that do not fit the queue
+        are summarized after a later reply.
+
+        Args:
+            client (AsyncOpenAI): OpenAI client
+            conversations (ConversationStore): Store keeping the turns to summarize
+            model (str): Model writing the summaries
+            history_backend (Optional[HistoryBackend]): Persistent storage for summaries
+            min_messages (int): Unsummarized turns that make a chat worth summarizing
+            rate (float): Summary requests per second
+            max_tokens (int): Maximum length of a summary in tokens
+            max_queued (int): Maximum number of chats waiting for a summary
+            request_timeout (float): Timeout in seconds for a summary request
+        """
+        self.client = client
+        self.conversations = conversations
+        self.model = model
+        self.history_backend = history_backend
+        self.min_messages = min_messages
+        self.max_tokens = max_tokens
+        self.request_timeout = request_timeout
+        self._bucket = TokenBucket(rate, 1)
+        self._queue: "asyncio.Queue[Conversation]" = asyncio.Queue(maxsize=max_queued)
+        self._queued: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.summaries = 0
+        self.failures = 0
+
+    def schedule(self, chat_id: int) -> None:
+        """
+        Queue a chat for summarizing if enough of its turns left the window
+
+        Args:
+            chat_id (int): Telegram chat ID
+        """
+        conversation = self.conversations.get(chat_id)
+        if conversation is None or len(conversation.overflow) < self.min_messages:
+            return
+        if chat_id in self._queued or self._queue.full():
+            return
+        self._queued.add(chat_id)
+        self._queue.put_nowait(conversation)
+
+    def start(self) -> None:
+        """Start the background worker"""
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        """Stop the background worker; unfinished summaries are retried after later replies"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _worker(self) -> None:
+        while True:
+            conversation = await self._queue.get()
+            self._queued.discard(conversation.chat_id)
+            await self._bucket.acquire()
+            try:
+                await self._summarize(conversation)
+            except Exception as e:
+                self.failures += 1
+                logging.error(f"Error summarizing conversation of chat {conversation.chat_id}: {e}")
+
+    async def _summarize(self, conversation: Conversation) -> None:
+        # Turns may keep arriving while the summary is generated; only these are covered
+        turns = list(conversation.overflow)
+        if not turns:
+            return
+        previous = conversation.summary["content"][len(SUMMARY_PREFIX):] if conversation.summary else None
+        prompt = conversation.prompt
+
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._request(previous, turns),
+            max_tokens=self.max_tokens,
+            temperature=0.2,
+            timeout=self.request_timeout
+        )
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            return
+        # The chat may have been reset meanwhile (e.g. a new prompt), and its stored
+        # history cleared; the summary belongs to the old conversation
+        current = self.conversations.peek(conversation.chat_id)
+        if current is not conversation or current.prompt != prompt:
+            return
+
+        self.conversations.set_summary(conversation, summary, turns)
+        if self.history_backend is not None:
+            self.history_backend.set_summary(conversation.chat_id, summary)
+        self.summaries += 1
+
+    @staticmethod
+    def _request(previous: Optional[str], turns: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        lines = [f"Current summary:\n{previous}" if previous else "Current summary: (none)", "", "New turns:"]
+        lines.extend(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": "\n".join(lines)},
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get summarizer statistics
+
+        Returns:
+            Dict[str, int]: Summaries written, failed attempts and chats waiting
+        """
+        return {
+            "summaries": self.summaries,
+            "failures": self.failures,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,57 @@
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is listed in requirements.txt
+    tiktoken = None
+
+# Fixed per-message cost of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Every reply is primed with an assistant header
+REPLY_OVERHEAD_TOKENS = 3
+
+
+class TokenCounter:
+    def __init__(self, model: str):
+        """
+        Count tokens locally for the given model
+
+        Falls back to a conservative character-based estimate when tiktoken
+        is not installed or its encoding cannot be loaded. tiktoken downloads
+        encodings on first use; to run offline, pre-fill the directory named
+        by TIKTOKEN_CACHE_DIR.
+
+        Args:
+            model (str): OpenAI model name
+        """
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Typically no network to download the encoding
+                logging.warning(f"Could not load tiktoken encoding, estimating token counts from text length: {e}")
+        else:
+            logging.warning("tiktoken is not installed, estimating token counts from text length")
+
+    def count(self, text: str) -> int:
+        """
+        Count the tokens of a text
+
+        Args:
+            text (str): Text to count
+
+        Returns:
+            int: Number of tokens
+        """
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # Cyrillic text averages roughly two characters per token
+        return len(text) // 2 + 1
+
+    def count_message(self, content: str) -> int:
+        """Count the tokens a chat message with the given content costs"""
+        return self.count(content) + MESSAGE_OVERHEAD_TOKENS
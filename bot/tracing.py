@@ -0,0 +1,157 @@
+import functools
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional, Tuple
+from config import TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD
+
+# Trace records go to their own logger so they can be routed or silenced separately
+trace_logger = logging.getLogger("bot.trace")
+
+
+class Trace:
+    """Spans of one update (or one reply turn), kept in memory until the trace ends"""
+
+    __slots__ = ("trace_id", "name", "chat_id", "update_id", "started", "spans")
+
+    def __init__(self, name: str, chat_id: Optional[int], update_id: Optional[int]):
+        self.trace_id = os.urandom(8).hex()
+        self.name = name
+        self.chat_id = chat_id
+        self.update_id = update_id
+        self.started = time.perf_counter()
+        # (name, start offset, duration, error class or None)
+        self.spans: List[Tuple[str, float, float, Optional[str]]] = []
+
+    def to_record(self, duration: float, error: Optional[str]) -> dict:
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "chat_id": self.chat_id,
+            "update_id": self.update_id,
+            "duration_ms": round(duration * 1000, 2),
+            "spans": [
+                {"name": name, "start_ms": round(start * 1000, 2), "duration_ms": round(length * 1000, 2),
+                 **({"error": span_error} if span_error else {})}
+                for name, start, length, span_error in self.spans
+            ],
+        }
+        if error:
+            record["error"] = error
+        return record
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, slow_threshold: float = 0.0):
+        """
+        Per-update trace spans written as JSON log records
+
+        While tracing is enabled, spans are recorded for every trace, which
+        only costs a few list appends. A finished trace is logged when it was
+        sampled (sample_rate), when it took longer than slow_threshold or when
+        it failed, so latency spikes are captured without logging every update.
+
+        Args:
+            sample_rate (float): Share of traces logged regardless of duration (0 to 1)
+            slow_threshold (float): Seconds after which a trace is always logged (0 disables)
+        """
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self._current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    @property
+    def current(self) -> Optional[Trace]:
+        return self._current.get()
+
+    def traced(self, name: str) -> Callable:
+        """Decorator starting a trace for a handler called as handler(self, update, context)"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(handler: Any, update: Any, *args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return await func(handler, update, *args, **kwargs)
+                chat = update.effective_chat
+                return await self.run(name, chat.id if chat else None, update.update_id,
+                                      func(handler, update, *args, **kwargs))
+            return wrapper
+        return decorator
+
+    async def run(self, name: str, chat_id: Optional[int], update_id: Optional[int], coro: Any) -> Any:
+        """
+        Await coro inside a new trace
+
+        Args:
+            name (str): Trace name
+            chat_id (Optional[int]): Chat the work belongs to
+            update_id (Optional[int]): Update that started the work
+            coro (Awaitable): Work to trace
+        """
+        if not self.enabled:
+            return await coro
+        trace = Trace(name, chat_id, update_id)
+        token = self._current.set(trace)
+        error = None
+        try:
+            return await coro
+        except BaseException as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            self._current.reset(token)
+            self._finish(trace, error)
+
+    def _finish(self, trace: Trace, error: Optional[str]) -> None:
+        duration = time.perf_counter() - trace.started
+        slow = 0 < self.slow_threshold <= duration
+        if error or slow or random.random() < self.sample_rate:
+            trace_logger.info(json.dumps(trace.to_record(duration, error)))
+
+    def span(self, name: str) -> "_Span":
+        """
+        Context manager timing a stage of the current trace; does nothing outside a trace
+
+        Args:
+            name (str): Stage name, e.g. "db.profile" or "openai.complete"
+        """
+        trace = self._current.get()
+        if trace is None:
+            return _NO_SPAN
+        return _Span(trace, name)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: Optional[Trace], name: str):
+        self.trace = trace
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self) -> "_Span":
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.trace is not None:
+            ended = time.perf_counter()
+            self.trace.spans.append((
+                self.name,
+                self.started - self.trace.started,
+                ended - self.started,
+                exc_type.__name__ if exc_type is not None else None
+            ))
+
+
+_NO_SPAN = _Span(None, "")
+
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD)
+traced = tracer.traced
+span = tracer.span
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class _ChatSlot:
+    """Per-chat lock plus the number of updates currently holding or waiting on it"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    # Given to the base class, whose semaphore is then never the limit; ours is
+    _UNLIMITED = 2 ** 30
+
+    def __init__(self, max_concurrent_updates: int, max_backlog: int = 1000, slow_wait_threshold: float = 5.0):
+        """
+        Process updates of different chats concurrently while keeping updates
+        of the same chat strictly in arrival order
+
+        The application hands every update to the processor as a new task
+        right away, so the processor bounds the backlog itself: updates are
+        only taken from a BackpressureQueue while fewer than max_backlog are
+        admitted, and otherwise wait in that bounded queue, which in turn
+        holds up the receiver.
+
+        Args:
+            max_concurrent_updates (int): Maximum number of updates processed at once
+            max_backlog (int): Maximum number of updates admitted (waiting or being processed)
+            slow_wait_threshold (float): Queue wait in seconds above which a warning is logged
+        """
+        # process_update is final in the base class and only takes its own
+        # semaphore, so the ordering and the real limit live in do_process_update
+        super().__init__(self._UNLIMITED)
+        self.slow_wait_threshold = slow_wait_threshold
+        self._workers = asyncio.Semaphore(max_concurrent_updates)
+        self.max_backlog = max_backlog
+        self.admitted = 0
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+        self._chats: Dict[int, _ChatSlot] = {}
+        self.queue_depth = 0
+        self.in_progress = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @staticmethod
+    def _chat_id(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Wait for the chat's turn, then for a free worker slot, then run the update.
+
+        The chat lock is taken before the worker slot so that updates queued
+        behind a busy chat don't occupy workers other chats could use.
+        """
+        chat_id = self._chat_id(update)
+        queued_at = time.monotonic()
+        self.queue_depth += 1
+
+        slot = None
+        if chat_id is not None:
+            slot = self._chats.get(chat_id)
+            if slot is None:
+                slot = self._chats[chat_id] = _ChatSlot()
+            slot.users += 1
+
+        started = False
+        try:
+            async with slot.lock if slot is not None else contextlib.nullcontext():
+                async with self._workers:
+                    started = True
+                    self._started(queued_at)
+                    try:
+                        await coroutine
+                    finally:
+                        self.in_progress -= 1
+        finally:
+            if not started:
+                self.queue_depth -= 1
+                # Never awaited, e.g. cancelled while waiting at shutdown
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if slot is not None:
+                slot.users -= 1
+                if not slot.users:
+                    self._chats.pop(chat_id, None)
+            self._release()
+
+    async def admit(self) -> None:
+        """Wait until the backlog has room, then reserve a place in it for the next update"""
+        while self.admitted >= self.max_backlog:
+            self._capacity.clear()
+            await self._capacity.wait()
+        self.admitted += 1
+
+    def _release(self) -> None:
+        self.admitted = max(0, self.admitted - 1)
+        if self.admitted < self.max_backlog:
+            self._capacity.set()
+
+    def _started(self, queued_at: float) -> None:
+        """Record queue metrics for an update that just got a worker"""
+        wait = time.monotonic() - queued_at
+        self.queue_depth -= 1
+        self.in_progress += 1
+        self.processed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > self.slow_wait_threshold:
+            logging.warning(
+                f"Update waited {wait:.2f}s in queue "
+                f"(queued: {self.queue_depth}, in progress: {self.in_progress})"
+            )
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get backlog statistics
+
+        Returns:
+            Dict[str, float]: Current queue depth, admitted backlog, in-progress count and wait times
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "in_progress": self.in_progress,
+            "processed": self.processed,
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class BackpressureQueue(asyncio.Queue):
+    def __init__(self, processor: ChatOrderedUpdateProcessor, maxsize: int = 0):
+        """
+        Update queue that only hands out updates while the processor's backlog has room
+
+        Args:
+            processor (ChatOrderedUpdateProcessor): Processor whose backlog is bounded
+            maxsize (int): Maximum number of received updates waiting to be admitted
+        """
+        super().__init__(maxsize)
+        self.processor = processor
+
+    async def get(self) -> Any:
+        await self.processor.admit()
+        return await super().get()
@@ -1,12 +1,116 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
 import logging
-from .database import DatabasePool
+from .cache import TTLCache
+from .database import DatabasePool, AsyncDatabasePool
+
+
+class _UserInsertBatcher:
+    def __init__(self, db: AsyncDatabasePool, max_batch: int, max_delay: float):
+        """
+        Group-commit user inserts: calls arriving within max_delay of each other
+        are written with a single multi-row INSERT on one connection
+
+        Args:
+            db (AsyncDatabasePool): Database access layer
+            max_batch (int): Number of pending rows that triggers an immediate write
+            max_delay (float): Seconds the first pending row waits for others to join it
+        """
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: Dict[int, Optional[str]] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: set = set()
+
+    async def add(self, chat_id: int, username: Optional[str]) -> Tuple[bool, bool]:
+        """
+        Queue a user row and wait until its batch is written
+
+        Returns:
+            Tuple[bool, bool]: Whether the write succeeded and whether every row
+            in the batch was new (so this user is known to be new)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[chat_id] = username
+        self._waiters.append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        rows, waiters = list(self._pending.items()), self._waiters
+        self._pending, self._waiters = {}, []
+        if rows:
+            task = asyncio.create_task(self._write(rows, waiters))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, rows: List[Tuple[int, Optional[str]]], waiters: List[asyncio.Future]) -> None:
+        try:
+            inserted = await self.db.run(self._insert_rows, rows)
+            result = (True, inserted == len(rows))
+        except Exception as e:
+            logging.error(f"Error initializing {len(rows)} users: {e}")
+            result = (False, False)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    @staticmethod
+    def _insert_rows(conn, rows: List[Tuple[int, Optional[str]]]) -> int:
+        cursor = conn.cursor()
+        placeholders = ", ".join(["(%s, %s)"] * len(rows))
+        cursor.execute(
+            f"INSERT IGNORE INTO users (chat_id, username) VALUES {placeholders}",
+            [value for row in rows for value in row]
+        )
+        inserted = cursor.rowcount
+        # A returning user (e.g. /start after unblocking the bot) receives broadcasts again
+        chat_ids = [chat_id for chat_id, _ in rows]
+        cursor.execute(
+            "UPDATE users SET blocked_at = NULL WHERE blocked_at IS NOT NULL "
+            f"AND chat_id IN ({', '.join(['%s'] * len(chat_ids))})",
+            chat_ids
+        )
+        conn.commit()
+        return inserted
 
 
 class UserManager:
-    def __init__(self):
+    # Columns the bot relies on, checked at startup
+    SCHEMA = {"users": ("chat_id", "name", "phone", "username", "registration_date", "blocked_at")}
+
+    def __init__(
+            self,
+            profile_cache_size: int = 10000,
+            profile_cache_ttl: float = 3600,
+            insert_batch_size: int = 500,
+            insert_batch_delay: float = 0.02
+    ):
+        """
+        Initialize user manager
+
+        Args:
+            profile_cache_size (int): Maximum number of cached profile-completeness flags
+            profile_cache_ttl (float): Seconds a cached flag stays valid
+            insert_batch_size (int): Maximum number of users created by one INSERT
+            insert_batch_delay (float): Seconds a new user waits for others to share its INSERT
+        """
         self.db_pool = DatabasePool.get_instance()
+        self.db = AsyncDatabasePool.get_instance()
         self.registration_states: Dict[int, str] = {}
+        # Write-through cache of has_complete_profile results keyed by chat_id
+        self.profile_cache: TTLCache[bool] = TTLCache(profile_cache_size, profile_cache_ttl)
+        self._insert_batcher = _UserInsertBatcher(self.db, insert_batch_size, insert_batch_delay)
         self._init_db()
 
     def _init_db(self) -> None:
@@ -20,115 +124,245 @@ class UserManager:
                         name VARCHAR(255),
                         phone VARCHAR(20),
                         username VARCHAR(255),
-                        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        blocked_at TIMESTAMP NULL DEFAULT NULL
                     )
                 ''')
+                # Tables created before blocked_at existed
+                cursor.execute("SHOW COLUMNS FROM users LIKE 'blocked_at'")
+                if cursor.fetchone() is None:
+                    cursor.execute("ALTER TABLE users ADD COLUMN blocked_at TIMESTAMP NULL DEFAULT NULL")
                 conn.commit()
         except Exception as e:
             logging.error(f"Database initialization error: {e}")
             raise
 
-    def initialize_user(self, chat_id: int, username: Optional[str] = None) -> bool:
+    async def initialize_user(self, chat_id: int, username: Optional[str] = None) -> bool:
         """Create initial user record with chat_id and username"""
+        # Concurrent calls (e.g. a /start storm) are merged into multi-row inserts
+        success, inserted = await self._insert_batcher.add(chat_id, username)
+
+        # A freshly inserted user has no name or phone yet
+        if inserted:
+            self.profile_cache.set(chat_id, False)
+        return success
+
+    async def update_user_info(self, chat_id: int, name: Optional[str] = None,
+                               phone: Optional[str] = None) -> bool:
+        """Update user information"""
         try:
-            with self.db_pool.get_connection() as conn:
-                cursor = conn.cursor()
+            success = await self.db.run(self._update_user_info, chat_id, name, phone)
+        except Exception as e:
+            logging.error(f"Error updating user info: {e}")
+            self.profile_cache.invalidate(chat_id)
+            return False
 
-                cursor.execute("""
-                    INSERT IGNORE INTO users (chat_id, username)
-                    VALUES (%s, %s)
-                """, (chat_id, username))
+        if success and name is not None and phone is not None:
+            self.profile_cache.set(chat_id, True)
+        else:
+            self.profile_cache.invalidate(chat_id)
+        return success
 
-                conn.commit()
-                return True
+    @staticmethod
+    def _update_user_info(conn, chat_id: int, name: Optional[str], phone: Optional[str]) -> bool:
+        cursor = conn.cursor()
 
-        except Exception as e:
-            logging.error(f"Error initializing user: {e}")
+        update_fields = []
+        params = []
+
+        if name is not None:
+            update_fields.append("name = %s")
+            params.append(name)
+        if phone is not None:
+            update_fields.append("phone = %s")
+            params.append(phone)
+
+        if not update_fields:
             return False
 
-    def update_user_info(self, chat_id: int, name: Optional[str] = None,
-                         phone: Optional[str] = None) -> bool:
-        """Update user information"""
-        try:
-            with self.db_pool.get_connection() as conn:
-                cursor = conn.cursor()
+        params.append(chat_id)
 
-                # First check if user exists
-                cursor.execute("SELECT chat_id FROM users WHERE chat_id = %s", (chat_id,))
-                if not cursor.fetchone():
-                    logging.warning(f"Attempted to update non-existent user: {chat_id}")
-                    return False
-
-                update_fields = []
-                params = []
-
-                if name is not None:
-                    update_fields.append("name = %s")
-                    params.append(name)
-                if phone is not None:
-                    update_fields.append("phone = %s")
-                    params.append(phone)
-
-                if not update_fields:
-                    return False
-
-                params.append(chat_id)
-
-                query = f"""
-                    UPDATE users 
-                    SET {', '.join(update_fields)}
-                    WHERE chat_id = %s
-                """
-                cursor.execute(query, params)
-                conn.commit()
-                return cursor.rowcount > 0
+        query = f"""
+            UPDATE users
+            SET {', '.join(update_fields)}
+            WHERE chat_id = %s
+        """
+        cursor.execute(query, params)
+        conn.commit()
+        if cursor.rowcount == 0:
+            logging.warning(f"Attempted to update non-existent or unchanged user: {chat_id}")
+        return cursor.rowcount > 0
 
+    async def register_contact(self, chat_id: int, name: str, phone: str) -> Optional[Dict]:
+        """
+        Store a shared contact and return the user's details, on a single connection checkout
+
+        Args:
+            chat_id (int): Telegram chat ID
+            name (str): Contact's first name
+            phone (str): Contact's phone number
+
+        Returns:
+            Optional[Dict]: name, phone, username and registration_date, or None on error
+        """
+        try:
+            details = await self.db.run(self._register_contact, chat_id, name, phone)
         except Exception as e:
-            logging.error(f"Error updating user info: {e}")
-            return False
+            logging.error(f"Error registering contact: {e}")
+            self.profile_cache.invalidate(chat_id)
+            return None
+
+        self.profile_cache.set(chat_id, True)
+        return details
 
-    def has_complete_profile(self, chat_id: int) -> bool:
+    @staticmethod
+    def _register_contact(conn, chat_id: int, name: str, phone: str) -> Optional[Dict]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            INSERT INTO users (chat_id, name, phone)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE name = VALUES(name), phone = VALUES(phone)
+        """, (chat_id, name, phone))
+        cursor.execute("""
+            SELECT name, phone, username, registration_date
+            FROM users
+            WHERE chat_id = %s
+        """, (chat_id,))
+        details = cursor.fetchone()
+        conn.commit()
+        return details
+
+    async def has_complete_profile(self, chat_id: int) -> bool:
         """Check if user has both name and phone"""
+        cached = self.profile_cache.get(chat_id)
+        if cached is not None:
+            return cached
+
         try:
-            with self.db_pool.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT 1 
-                    FROM users 
-                    WHERE chat_id = %s 
-                    AND name IS NOT NULL 
-                    AND phone IS NOT NULL
-                """, (chat_id,))
-                return cursor.fetchone() is not None
+            complete = await self.db.run(self._has_complete_profile, chat_id)
         except Exception as e:
             logging.error(f"Error checking user profile: {e}")
             return False
 
-    def get_user_details(self, chat_id: int) -> Optional[Dict]:
+        self.profile_cache.set(chat_id, complete)
+        return complete
+
+    @staticmethod
+    def _has_complete_profile(conn, chat_id: int) -> bool:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT 1
+            FROM users
+            WHERE chat_id = %s
+            AND name IS NOT NULL
+            AND phone IS NOT NULL
+        """, (chat_id,))
+        return cursor.fetchone() is not None
+
+    async def mark_blocked(self, chat_ids: List[int]) -> bool:
+        """Mark users who blocked the bot, so broadcasts skip them"""
+        if not chat_ids:
+            return True
+        try:
+            await self.db.run(self._mark_blocked, chat_ids)
+            return True
+        except Exception as e:
+            logging.error(f"Error marking {len(chat_ids)} users as blocked: {e}")
+            return False
+
+    @staticmethod
+    def _mark_blocked(conn, chat_ids: List[int]) -> None:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET blocked_at = CURRENT_TIMESTAMP WHERE blocked_at IS NULL "
+            f"AND chat_id IN ({', '.join(['%s'] * len(chat_ids))})",
+            chat_ids
+        )
+        conn.commit()
+
+    async def get_recipients(self, after_chat_id: int, limit: int) -> Optional[List[int]]:
+        """
+        Get a page of users that have not blocked the bot, in chat_id order
+
+        Pages are read by key (chat_id > after_chat_id) rather than by offset,
+        so each page is an index range scan and no connection stays checked
+        out between pages.
+
+        Args:
+            after_chat_id (int): Last chat_id of the previous page (0 for the first page)
+            limit (int): Page size
+
+        Returns:
+            Optional[List[int]]: Chat IDs, empty after the last page, None on error
+        """
+        try:
+            return await self.db.run(self._get_recipients, after_chat_id, limit)
+        except Exception as e:
+            logging.error(f"Error reading recipients: {e}")
+            return None
+
+    @staticmethod
+    def _get_recipients(conn, after_chat_id: int, limit: int) -> List[int]:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT chat_id
+            FROM users
+            WHERE chat_id > %s
+            AND blocked_at IS NULL
+            ORDER BY chat_id
+            LIMIT %s
+        """, (after_chat_id, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+    async def count_recipients(self) -> Optional[int]:
+        """Count users that have not blocked the bot"""
+        try:
+            return await self.db.run(self._count_recipients)
+        except Exception as e:
+            logging.error(f"Error counting recipients: {e}")
+            return None
+
+    @staticmethod
+    def _count_recipients(conn) -> int:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users WHERE blocked_at IS NULL")
+        return cursor.fetchone()[0]
+
+    def profile_cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss statistics of the profile-completeness cache"""
+        return self.profile_cache.stats()
+
+    async def get_user_details(self, chat_id: int) -> Optional[Dict]:
         """Get user details for admin notification"""
         try:
-            with self.db_pool.get_connection() as conn:
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute("""
-                    SELECT name, phone, username, registration_date
-                    FROM users 
-                    WHERE chat_id = %s
-                """, (chat_id,))
-                return cursor.fetchone()
+            return await self.db.run(self._get_user_details, chat_id)
         except Exception as e:
             logging.error(f"Error getting user details: {e}")
             return None
 
-    def get_user(self, chat_id: int) -> Optional[Dict]:
+    @staticmethod
+    def _get_user_details(conn, chat_id: int) -> Optional[Dict]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT name, phone, username, registration_date
+            FROM users
+            WHERE chat_id = %s
+        """, (chat_id,))
+        return cursor.fetchone()
+
+    async def get_user(self, chat_id: int) -> Optional[Dict]:
         """Get user information"""
         try:
-            with self.db_pool.get_connection() as conn:
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute("""
-                    SELECT chat_id, name, phone, username, registration_date
-                    FROM users WHERE chat_id = %s
-                """, (chat_id,))
-                return cursor.fetchone()
+            return await self.db.run(self._get_user, chat_id)
         except Exception as e:
             logging.error(f"Error getting user: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def _get_user(conn, chat_id: int) -> Optional[Dict]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT chat_id, name, phone, username, registration_date
+            FROM users WHERE chat_id = %s
+        """, (chat_id,))
+        return cursor.fetchone()
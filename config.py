@@ -6,7 +6,124 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 CONFIG_FILE = "data/bot_config.xlsx"
+# Seconds between checks of CONFIG_FILE for changes (0 disables hot reload)
+CONFIG_RELOAD_INTERVAL = float(os.getenv("CONFIG_RELOAD_INTERVAL", 5))
 LOG_LEVEL = "INFO"
+# Port of the Prometheus metrics endpoint (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+# Per-update traces logged as JSON on the "bot.trace" logger: a sampled share of all traces
+# plus every trace slower than TRACE_SLOW_THRESHOLD seconds (both 0 disables tracing);
+# the rate can be changed at runtime with /trace
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", 5))
+# Longest run of the admin /profile sampling profiler
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+
+# How updates are received: "polling" or "webhook"
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling")
+# Override for the Bot API URL (e.g. a local fake Telegram server)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL") or None
+# Number of worker processes; above 1 a supervisor shards chats across workers by chat ID
+# (each worker serves metrics on METRICS_PORT + 1 + its index)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))
+# Keep-alive HTTP connections to the Bot API, and how many are opened at startup
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 256))
+TELEGRAM_WARM_CONNECTIONS = int(os.getenv("TELEGRAM_WARM_CONNECTIONS", 8))
+# Maximum number of received updates waiting to be processed
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+
+# Webhook mode: local server address, public URL registered with Telegram and secret token
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# OpenAI client
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 50))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", 700))
+# Keep-alive HTTP connections to OpenAI (defaults to OPENAI_MAX_CONCURRENCY), seconds an idle
+# one is kept, and how many are opened at startup
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", OPENAI_MAX_CONCURRENCY))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+OPENAI_WARM_CONNECTIONS = int(os.getenv("OPENAI_WARM_CONNECTIONS", 4))
+# Resilience of completion calls: retries with jittered backoff within a deadline,
+# hedged duplicates of slow requests (after the recent p95 latency, for at most
+# OPENAI_HEDGE_BUDGET of requests), and a circuit breaker that switches to
+# OPENAI_FALLBACK_MODEL (or fails fast if unset) while OpenAI keeps failing
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", 60))
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "false").lower() in ("1", "true", "yes")
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv("OPENAI_HEDGE_MIN_DELAY", 2.0))
+OPENAI_HEDGE_BUDGET = float(os.getenv("OPENAI_HEDGE_BUDGET", 0.1))
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", 5))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", 30))
+OPENAI_FALLBACK_MODEL = os.getenv("OPENAI_FALLBACK_MODEL") or None
+# Tokens allowed per request for system prompt + history + reply
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 4096))
+
+# Stream replies into Telegram via progressive message edits
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() in ("1", "true", "yes")
+# Minimum seconds between edits of a streamed message (Telegram rate-limits edits)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+# Render ChatGPT's Markdown as Telegram formatting (falls back to plain text if Telegram rejects it)
+FORMAT_REPLIES = os.getenv("FORMAT_REPLIES", "true").lower() in ("1", "true", "yes")
+
+# Outbound Telegram queue: global and per-chat send rates, workers and retries
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", 3))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", 32))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+
+# Per-chat admission control: messages per second a chat may send to ChatGPT (0 disables the limit),
+# burst size, and seconds a chat must be quiet before messages sent during a reply become the next turn
+# (a chat's first message is answered right away).
+# The defaults only stop floods; a normal conversation never reaches them
+CHAT_MESSAGE_RATE = float(os.getenv("CHAT_MESSAGE_RATE", 1))
+CHAT_MESSAGE_BURST = float(os.getenv("CHAT_MESSAGE_BURST", 20))
+MESSAGE_DEBOUNCE = float(os.getenv("MESSAGE_DEBOUNCE", 1.0))
+# Chats whose turn may be running or waiting at once; messages of further chats wait in their
+# update handler, so an overload shows up in the update queue and backlog
+MAX_PENDING_TURNS = int(os.getenv("MAX_PENDING_TURNS", 200))
+
+# In-memory conversation histories
+# Upper bound on messages kept per chat; what is sent is limited by CONTEXT_TOKEN_BUDGET
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", 40))
+CONVERSATION_MAX_CHATS = int(os.getenv("CONVERSATION_MAX_CHATS", 10000))
+CONVERSATION_MAX_CHARS = int(os.getenv("CONVERSATION_MAX_CHARS", 20_000_000))
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", 86400))
+# Compact messages leaving the HISTORY_MAX_MESSAGES window into a running summary, written in the
+# background after replies (pair with a small window, e.g. 8): summarize once SUMMARY_MIN_MESSAGES
+# messages left the window, at most SUMMARY_RATE requests per second, in up to SUMMARY_MAX_TOKENS
+CONVERSATION_SUMMARY = os.getenv("CONVERSATION_SUMMARY", "false").lower() in ("1", "true", "yes")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL") or OPENAI_MODEL
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", 4))
+SUMMARY_RATE = float(os.getenv("SUMMARY_RATE", 1))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 300))
+
+# Cache of replies to common opening questions (0 disables it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 0))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+# Prior messages a conversation may have for its turn to be served from the cache
+RESPONSE_CACHE_MAX_HISTORY = int(os.getenv("RESPONSE_CACHE_MAX_HISTORY", 0))
+
+# Persistent conversation history: "sqlite", "mysql" or "none"
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_SQLITE_PATH = os.getenv("HISTORY_SQLITE_PATH", "data/history.sqlite3")
+# Seconds between batched writes of new messages
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 1.0))
+
+# Update processing: number of updates handled in parallel (updates of one chat stay ordered).
+# Set to 1 to process updates sequentially.
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 64))
+# Updates admitted for processing at once (running or waiting for their chat or a worker);
+# beyond that, received updates wait in the UPDATE_QUEUE_SIZE queue and then hold up the receiver
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", 1000))
 
 DB_CONFIG = {
     'host': os.getenv('DB_HOST'),
@@ -14,4 +131,18 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD'),
     'database': os.getenv('DB_NAME'),
     'port': int(os.getenv('DB_PORT', 3306))
-}
\ No newline at end of file
+}
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', 10))
+
+# Group-commit of new users: rows per INSERT and seconds a row waits for others
+USER_INSERT_BATCH_SIZE = int(os.getenv('USER_INSERT_BATCH_SIZE', 500))
+USER_INSERT_BATCH_DELAY = float(os.getenv('USER_INSERT_BATCH_DELAY', 0.02))
+
+# Broadcasts: recipients read and checkpointed per page, seconds between progress reports to the admin
+BROADCAST_PAGE_SIZE = int(os.getenv('BROADCAST_PAGE_SIZE', 100))
+BROADCAST_REPORT_INTERVAL = float(os.getenv('BROADCAST_REPORT_INTERVAL', 30))
+
+# Profile-completeness cache in UserManager
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 3600))
@@ -1,11 +1,22 @@
 from bot.core import TelegramBot
+from bot.sharding import Supervisor
 from bot.utils import setup_logging
-from config import TELEGRAM_TOKEN, OPENAI_API_KEY, CONFIG_FILE, LOG_LEVEL
+from config import TELEGRAM_TOKEN, OPENAI_API_KEY, CONFIG_FILE, LOG_LEVEL, BOT_WORKERS
 
 
 def main():
     setup_logging(LOG_LEVEL)
 
+    if BOT_WORKERS > 1:
+        # Receive updates here and run the bot in worker processes sharded by chat
+        Supervisor(
+            worker_count=BOT_WORKERS,
+            telegram_token=TELEGRAM_TOKEN,
+            openai_api_key=OPENAI_API_KEY,
+            config_file=CONFIG_FILE
+        ).run()
+        return
+
     bot = TelegramBot(
         telegram_token=TELEGRAM_TOKEN,
         openai_api_key=OPENAI_API_KEY,
@@ -17,4 +28,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+
+from bot.admission import MessageCoalescer
+
+
+class Recorder:
+    """process callback recording turns; each turn waits until released"""
+
+    def __init__(self):
+        self.turns = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, chat_id, text):
+        self.turns.append((chat_id, text))
+        await self.release.wait()
+
+
+def test_messages_arriving_during_a_turn_are_merged_in_order():
+    async def main():
+        recorder = Recorder()
+        coalescer = MessageCoalescer(recorder, rate=0, debounce=0)
+        assert await coalescer.add(1, "first") is True
+        await asyncio.sleep(0)
+        assert recorder.turns == [(1, "first")]
+        await coalescer.add(1, "second")
+        await coalescer.add(1, "third")
+        recorder.release.set()
+        await coalescer.stop()
+        return recorder.turns, coalescer.stats()
+
+    turns, stats = asyncio.run(main())
+    assert turns == [(1, "first"), (1, "second\n\nthird")]
+    assert stats["admitted"] == 3 and stats["turns"] == 2 and stats["pending_chats"] == 0
+
+
+def test_chats_are_answered_independently():
+    async def main():
+        recorder = Recorder()
+        coalescer = MessageCoalescer(recorder, rate=0, debounce=0)
+        await coalescer.add(1, "a")
+        await coalescer.add(2, "b")
+        await asyncio.sleep(0)
+        running = coalescer.stats()["running"]
+        recorder.release.set()
+        await coalescer.stop()
+        return recorder.turns, running
+
+    turns, running = asyncio.run(main())
+    assert sorted(turns) == [(1, "a"), (2, "b")]
+    assert running == 2
+
+
+def test_rate_limited_chat_is_told_once():
+    async def main():
+        recorder = Recorder()
+        recorder.release.set()
+        coalescer = MessageCoalescer(recorder, rate=0.001, burst=2, debounce=0)
+        results = [await coalescer.add(1, f"message {i}") for i in range(4)]
+        other = await coalescer.add(2, "other chat")
+        await coalescer.stop()
+        return results, other, coalescer.stats()
+
+    results, other, stats = asyncio.run(main())
+    assert results == [True, True, False, None]
+    assert other is True
+    assert stats["rejected"] == 2
+
+
+def test_new_chats_wait_for_room():
+    async def main():
+        recorder = Recorder()
+        coalescer = MessageCoalescer(recorder, rate=0, debounce=0, max_chats=2)
+        await coalescer.add(1, "a")
+        await coalescer.add(2, "b")
+        third = asyncio.ensure_future(coalescer.add(3, "c"))
+        await asyncio.sleep(0.01)
+        waiting = not third.done(), coalescer.stats()["waiting"]
+        # A chat that already has a turn is merged without waiting
+        await coalescer.add(1, "a2")
+        recorder.release.set()
+        assert await third is True
+        await coalescer.stop()
+        return waiting, recorder.turns
+
+    waiting, turns = asyncio.run(main())
+    assert waiting == (True, 1)
+    assert turns[:2] == [(1, "a"), (2, "b")]
+    assert sorted(turns[2:]) == [(1, "a2"), (3, "c")]
+
+
+def test_first_message_starts_a_turn_right_away():
+    async def main():
+        recorder = Recorder()
+        coalescer = MessageCoalescer(recorder, rate=0, debounce=0.05)
+        await coalescer.add(1, "first")
+        await asyncio.sleep(0)
+        started = list(recorder.turns)
+        await coalescer.add(1, "second")
+        recorder.release.set()
+        await asyncio.sleep(0.01)
+        # The follow-up waits until the chat was quiet for the debounce window
+        before_quiet = list(recorder.turns)
+        await coalescer.stop()
+        return started, before_quiet, recorder.turns
+
+    started, before_quiet, turns = asyncio.run(main())
+    assert started == [(1, "first")]
+    assert before_quiet == [(1, "first")]
+    assert turns == [(1, "first"), (1, "second")]
+
+
+def test_limit_episodes_end_when_the_bucket_refills():
+    async def main():
+        coalescer = MessageCoalescer(Recorder(), rate=100, burst=1, debounce=0)
+        await coalescer.add(1, "a")
+        assert await coalescer.add(1, "b") is False
+        await asyncio.sleep(0.05)
+        await coalescer.add(2, "a")
+        assert await coalescer.add(2, "b") is False
+        return set(coalescer._limited)
+
+    assert asyncio.run(main()) == {2}
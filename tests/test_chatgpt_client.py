@@ -0,0 +1,78 @@
+import asyncio
+
+from bot.chatgpt_client import ChatGPTClient
+from bot.history_backend import PROMPT_ROLE, SUMMARY_ROLE
+
+PROMPT = "You are a helpful consultant."
+
+
+class FakeConfig:
+    instructions = {"prompt": PROMPT}
+
+
+class FakeHistory:
+    """Records buffered operations instead of writing them"""
+
+    def __init__(self, rows=(), error=None):
+        self.rows = list(rows)
+        self.error = error
+        self.operations = []
+
+    async def load(self, chat_id):
+        if self.error is not None:
+            raise self.error
+        return self.rows
+
+    def append(self, chat_id, role, content):
+        self.operations.append(("append", chat_id, role, content))
+
+    def set_summary(self, chat_id, content):
+        self.operations.append(("summary", chat_id, content))
+
+    def set_prompt(self, chat_id, prompt_hash):
+        self.operations.append(("prompt", chat_id, prompt_hash))
+
+    def clear(self, chat_id):
+        self.operations.append(("clear", chat_id))
+
+
+def client(history):
+    return ChatGPTClient("sk-test", FakeConfig(), history_backend=history)
+
+
+def restore(history, chat_id=1):
+    return asyncio.run(client(history)._get_conversation(chat_id, PROMPT))
+
+
+def test_history_under_the_same_prompt_is_restored():
+    history = FakeHistory([
+        (PROMPT_ROLE, ChatGPTClient._prompt_hash(PROMPT)),
+        (SUMMARY_ROLE, "Likes tea"),
+        ("user", "Hi"),
+        ("assistant", "Hello!"),
+    ])
+    conversation = restore(history)
+    assert [message["content"] for message in conversation.messages] == ["Hi", "Hello!"]
+    assert conversation.summary["content"].endswith("Likes tea")
+    assert history.operations == []
+
+
+def test_history_under_another_prompt_is_dropped():
+    history = FakeHistory([(PROMPT_ROLE, ChatGPTClient._prompt_hash("Old prompt")), ("user", "Hi")])
+    conversation = restore(history)
+    assert not conversation.messages
+    assert history.operations == [("clear", 1), ("prompt", 1, ChatGPTClient._prompt_hash(PROMPT))]
+
+
+def test_history_without_prompt_is_dropped():
+    history = FakeHistory([("user", "Hi")])
+    assert not restore(history).messages
+    assert history.operations[0] == ("clear", 1)
+
+
+def test_failed_load_keeps_stored_history():
+    history = FakeHistory(error=ConnectionError("database is down"))
+    conversation = restore(history)
+    assert conversation.prompt == PROMPT
+    assert not conversation.messages
+    assert history.operations == []
@@ -0,0 +1,77 @@
+from bot.formatting import MAX_MESSAGE_LENGTH, markdown_to_html, split_message, text_length
+
+
+def test_short_text_is_one_chunk():
+    assert split_message("Hello") == ["Hello"]
+
+
+def test_split_prefers_paragraphs():
+    text = "First paragraph.\n\nSecond paragraph."
+    assert split_message(text, limit=25) == ["First paragraph.", "Second paragraph."]
+
+
+def test_split_prefers_sentences_over_words():
+    text = "One sentence here. Another sentence follows"
+    assert split_message(text, limit=30) == ["One sentence here.", "Another sentence follows"]
+
+
+def test_chunks_fit_the_limit_in_utf16_units():
+    text = ("😀 word " * 2000).strip()
+    chunks = split_message(text)
+    assert len(chunks) > 1
+    assert all(text_length(chunk) <= MAX_MESSAGE_LENGTH for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_text_without_spaces_is_hard_split():
+    chunks = split_message("x" * 25, limit=10)
+    assert chunks == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_split_code_block_is_closed_and_reopened():
+    text = "```\n" + "\n".join(f"line {i}" for i in range(20)) + "\n```"
+    chunks = split_message(text, limit=60, markdown=True)
+    assert len(chunks) > 1
+    assert all(chunk.count("```") == 2 for chunk in chunks)
+    assert all(len(chunk) <= 60 for chunk in chunks)
+
+
+def test_plain_text_needs_no_formatting():
+    assert markdown_to_html("Just text, with 2 < 3.") is None
+
+
+def test_inline_formatting():
+    assert markdown_to_html("**bold**, *italic*, ~~gone~~ and `a < b`") == (
+        "<b>bold</b>, <i>italic</i>, <s>gone</s> and <code>a &lt; b</code>"
+    )
+
+
+def test_underscore_bold():
+    assert markdown_to_html("some __bold__ text") == "some <b>bold</b> text"
+
+
+def test_identifiers_are_not_formatted():
+    for text in ("Override __init__(self) here", "call obj.__init__()", "snake__case__name and my_var_name"):
+        assert markdown_to_html(text) is None
+
+
+def test_code_is_not_formatted():
+    assert markdown_to_html("Use `__init__` or `**kwargs`") == "Use <code>__init__</code> or <code>**kwargs</code>"
+    assert markdown_to_html("```python\ndef f(**kw): return 1 < 2\n```") == (
+        "<pre><code>def f(**kw): return 1 &lt; 2</code></pre>"
+    )
+
+
+def test_headings_bullets_and_links():
+    text = "# Title\n- item\n[site](https://example.com/?a=1&b=\"2\")"
+    assert markdown_to_html(text) == (
+        '<b>Title</b>\n• item\n<a href="https://example.com/?a=1&amp;b=&quot;2&quot;">site</a>'
+    )
+
+
+def test_bare_urls_keep_their_underscores():
+    assert markdown_to_html("see https://x.com/_a_/b") is None
+    assert markdown_to_html("**Docs:** https://x.com/my_page_v2, *really*") == (
+        "<b>Docs:</b> https://x.com/my_page_v2, <i>really</i>"
+    )
+    assert markdown_to_html("[a_b_c](https://x.com/_a_/b)") == '<a href="https://x.com/_a_/b">a_b_c</a>'
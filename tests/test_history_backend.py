@@ -0,0 +1,68 @@
+import asyncio
+
+from bot.history_backend import PROMPT_ROLE, SQLiteHistoryBackend
+
+
+def backend(tmp_path, **kwargs):
+    return SQLiteHistoryBackend(str(tmp_path / "history.db"), flush_interval=3600, **kwargs)
+
+
+def run(history, scenario):
+    async def main():
+        await history.start()
+        try:
+            return await scenario()
+        finally:
+            await history.close()
+    return asyncio.run(main())
+
+
+def test_messages_and_prompt_are_restored(tmp_path):
+    history = backend(tmp_path)
+    history.set_prompt(1, "abc")
+    history.append(1, "user", "Hi")
+    history.append(1, "assistant", "Hello!")
+    history.append(2, "user", "Other chat")
+    assert run(history, lambda: history.load(1)) == [(PROMPT_ROLE, "abc"), ("user", "Hi"), ("assistant", "Hello!")]
+
+
+def test_flush_writes_in_batches(tmp_path):
+    history = backend(tmp_path, batch_size=3)
+    sizes = []
+    write = history._write
+
+    def recording_write(conn, operations):
+        sizes.append(len(operations))
+        write(conn, operations)
+
+    history._write = recording_write
+    for i in range(7):
+        history.append(1, "user", f"message {i}")
+    run(history, history.flush)
+    assert sizes == [3, 3, 1]
+
+
+def test_bad_operation_is_dropped_after_max_attempts(tmp_path):
+    history = backend(tmp_path, max_attempts=2)
+    history.append(1, "user", "before")
+    # Violates the NOT NULL constraint on content
+    history.append(1, "user", None)
+    history.append(1, "user", "after")
+
+    async def scenario():
+        await history.flush()
+        assert len(history._pending) == 3
+        await history.flush()
+        return await history.load(1)
+
+    assert run(history, scenario) == [("user", "before"), ("user", "after")]
+    assert history.dropped == 1
+
+
+def test_buffer_drops_the_oldest_operations_when_full(tmp_path):
+    history = backend(tmp_path, batch_size=2, max_pending=5)
+    for i in range(8):
+        history.append(1, "user", f"message {i}")
+    assert len(history._pending) <= 5
+    assert history.dropped == 8 - len(history._pending)
+    assert history._pending[-1][3] == "message 7"
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import APIConnectionError, BadRequestError
+
+from bot import resilience
+from bot.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def connection_error():
+    return APIConnectionError(request=REQUEST)
+
+
+def bad_request():
+    return BadRequestError("context length exceeded", response=httpx.Response(400, request=REQUEST), body=None)
+
+
+def caller(breaker):
+    return ResilientCaller("gpt", max_retries=0, breaker=breaker)
+
+
+def call(resilient, outcome):
+    async def request(model):
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return asyncio.run(resilient.call(request))
+
+
+def test_breaker_closed_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    resilient = caller(breaker)
+
+    for _ in range(2):
+        with pytest.raises(APIConnectionError):
+            call(resilient, connection_error())
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call(resilient, "ok")
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.release_trial()
+
+    assert call(resilient, "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    resilient = caller(breaker)
+    with pytest.raises(APIConnectionError):
+        call(resilient, connection_error())
+
+    clock.now += 30
+    with pytest.raises(APIConnectionError):
+        call(resilient, connection_error())
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call(resilient, "ok")
+
+
+def test_non_retryable_error_ends_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    resilient = caller(breaker)
+    with pytest.raises(APIConnectionError):
+        call(resilient, connection_error())
+
+    clock.now += 30
+    with pytest.raises(BadRequestError):
+        call(resilient, bad_request())
+    # The service answered, so the circuit closes instead of staying half-open
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert call(resilient, "ok") == "ok"
+
+
+def test_cancelled_trial_lets_another_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    resilient = caller(breaker)
+    with pytest.raises(APIConnectionError):
+        call(resilient, connection_error())
+
+    clock.now += 30
+
+    async def cancelled_trial():
+        async def hang(model):
+            await asyncio.sleep(3600)
+        task = asyncio.ensure_future(resilient.call(hang))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled_trial())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert call(resilient, "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_fallback_model_while_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    resilient = ResilientCaller("gpt", fallback_model="backup", max_retries=0, breaker=breaker)
+    with pytest.raises(APIConnectionError):
+        call(resilient, connection_error())
+
+    async def model_name(model):
+        return model
+    assert asyncio.run(resilient.call(model_name)) == "backup"
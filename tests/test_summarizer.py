@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.conversation_store import ConversationStore
+from bot.summarizer import ConversationSummarizer
+
+
+class FakeCompletions:
+    def __init__(self, reply, before_reply=None):
+        self.reply = reply
+        self.before_reply = before_reply
+
+    async def create(self, **kwargs):
+        if self.before_reply is not None:
+            self.before_reply()
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeHistory:
+    def __init__(self):
+        self.summaries = []
+
+    def set_summary(self, chat_id, content):
+        self.summaries.append((chat_id, content))
+
+
+def conversation_with_overflow(store):
+    conversation = store.reset(1, "Prompt")
+    for i in range(4):
+        store.append(conversation, "user", f"message {i}")
+    return conversation
+
+
+def summarize(store, conversation, before_reply=None):
+    history = FakeHistory()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions("Likes tea", before_reply)))
+    summarizer = ConversationSummarizer(client, store, "gpt", history_backend=history)
+    asyncio.run(summarizer._summarize(conversation))
+    return summarizer, history
+
+
+def test_summary_replaces_summarized_turns():
+    store = ConversationStore(max_messages=2, summarize=True)
+    conversation = conversation_with_overflow(store)
+    summarizer, history = summarize(store, conversation)
+    assert conversation.summary["content"].endswith("Likes tea")
+    assert not conversation.overflow
+    assert history.summaries == [(1, "Likes tea")]
+    assert summarizer.summaries == 1
+
+
+def test_summary_of_a_reset_conversation_is_dropped():
+    store = ConversationStore(max_messages=2, summarize=True)
+    conversation = conversation_with_overflow(store)
+    summarizer, history = summarize(store, conversation, lambda: store.reset(1, "New prompt"))
+    assert conversation.summary is None
+    assert store.peek(1).summary is None
+    assert history.summaries == []
+    assert summarizer.summaries == 0